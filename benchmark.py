@@ -0,0 +1,293 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pymesh
+
+import crackFront as cf
+import crackMesh as cm
+import intersection as ix
+import simulation
+
+HALF_SIZE = 5.5
+
+# Creates one step of a crack front of numMarkers markers near the surface of a box with the given half size
+def createFrontStep(numMarkers, halfSize, moveSpeed = .095, seed = 0):
+    rng = np.random.default_rng(seed)
+    front = cf.CrackFront.ring([0., 0., 0.], numMarkers)
+    # Start each marker up to two steps short of where its direction leaves the box, so about half of them hit it
+    exitDistances = halfSize / np.abs(front.directions).max(axis=1)
+    radii = exitDistances - rng.uniform(0., 2. * moveSpeed, numMarkers)
+
+    front.prevLocations = front.directions * radii[:, np.newaxis]
+    front.prevLocations[:, 1] = rng.uniform(-halfSize, halfSize, numMarkers) * .9
+    front.currLocations = front.prevLocations + front.directions * moveSpeed
+
+    return front
+
+# Creates a crack whose front is the step from createFrontStep, with its own seeded stream for propagation
+def createCrackStep(numMarkers, halfSize, seed = 0):
+    crack = cm.CrackMesh([0., 0., 0.], numMarkers, np.random.default_rng(seed))
+    step = createFrontStep(numMarkers, halfSize, crack.moveSpeed, seed)
+
+    crack.front.prevLocations[:] = step.prevLocations
+    crack.front.currLocations[:] = step.currLocations
+
+    return crack
+
+def createBox(numSamples, halfSize = HALF_SIZE):
+    return pymesh.generate_box_mesh(np.full(3, -halfSize), np.full(3, halfSize), num_samples = numSamples,
+                                    keep_symmetry=False, subdiv_order=1)
+
+# Best wall-clock time of repeats calls. setup, if given, is called untimed before each call and its result passed in,
+# for functions that change what they work on
+def timeCall(function, repeats, setup = None):
+    best = float('inf')
+    for i in range(repeats):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+# Peak bytes allocated by one untimed call, as seen by tracemalloc (numpy reports its buffers to it)
+def peakMemory(function, setup = None):
+    args = () if setup is None else (setup(),)
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def report(result):
+    print(json.dumps(result))
+
+    return result
+
+# Times the brute force and BVH intersection paths against box meshes of increasing size
+def benchmarkIntersection(sampleCounts, numMarkers = 120, repeats = 3, bruteForceLimit = 200000):
+    results = []
+
+    for numSamples in sampleCounts:
+        box = createBox(numSamples)
+        front = createFrontStep(numMarkers, HALF_SIZE)
+        result = {"benchmark": "intersection", "numSamples": numSamples, "numFaces": len(box.faces),
+                  "numMarkers": numMarkers}
+
+        buildTime, bvhIntersector = timeCall(lambda: ix.TriangleIntersector.fromMesh(box, useBvh=True), 1)
+        bvhTime, (bvhHits, bvhPoints) = timeCall(
+            lambda: bvhIntersector.intersect(front.prevLocations, front.currLocations), repeats)
+        result.update({"bvhBuild": buildTime, "bvhQuery": bvhTime, "time": bvhTime, "hits": int(bvhHits.sum())})
+
+        if len(box.faces) <= bruteForceLimit:
+            bruteIntersector = ix.TriangleIntersector.fromMesh(box, useBvh=False)
+            bruteTime, (bruteHits, brutePoints) = timeCall(
+                lambda: bruteIntersector.intersect(front.prevLocations, front.currLocations), repeats)
+
+            result["bruteForce"] = bruteTime
+            result["speedup"] = bruteTime / bvhTime
+            result["matches"] = bool(np.array_equal(bruteHits, bvhHits) and
+                                     np.array_equal(brutePoints[bruteHits], bvhPoints[bvhHits]))
+
+        results.append(report(result))
+
+    return results
+
+# Times each stage of a step on its own, on a synthetic front of every size in markerCounts against a host box
+# subdivided by every value in sampleCounts. The per-marker checkIntersection loop is only timed up to
+# perMarkerLimit markers, as it is there to compare against rather than to be used
+def benchmarkStages(markerCounts, sampleCounts, repeats = 3, perMarkerLimit = 1000):
+    results = []
+    lowToughnessAreas = [HALF_SIZE - 2.5, -HALF_SIZE - 2.]
+
+    for numSamples in sampleCounts:
+        box = createBox(numSamples)
+        intersector = ix.TriangleIntersector.fromMesh(box)
+        sim = simulation.Simulation(keepScenes = False)
+
+        for numMarkers in markerCounts:
+            def crackStep():
+                return createCrackStep(numMarkers, HALF_SIZE)
+
+            # A crack that has already added its previous step to its mesh buffer, then moved on by one more
+            def bufferedCrackStep():
+                crack = crackStep()
+                crack.appendToMeshBuffer()
+                crack.front.prevLocations[:] = crack.front.currLocations
+                crack.front.currLocations += crack.front.directions * crack.moveSpeed
+                sim.crack = crack
+                sim.cracks = [crack]
+                sim.crackBuffer = crack.meshBuffer
+                return crack
+
+            stages = {
+                "propagateCrackFront": (lambda crack: crack.propagateCrackFront(intersector, lowToughnessAreas, False),
+                                        crackStep),
+                "checkIntersections": (lambda crack: crack.checkIntersections(intersector, np.arange(numMarkers)),
+                                       crackStep),
+                "smoothMesh": (lambda crack: crack.smoothMesh(), crackStep),
+                "createCrackMesh": (lambda crack: crack.createCrackMesh(), crackStep),
+                "processCrackMesh": (lambda crack: sim.processCrackMesh(), bufferedCrackStep),
+            }
+
+            if numMarkers <= perMarkerLimit:
+                stages["checkIntersection"] = (
+                    lambda crack: [crack.checkIntersection(marker, intersector) for marker in crack.markers], crackStep)
+
+            for name, (function, setup) in stages.items():
+                seconds = timeCall(function, repeats, setup)[0]
+                result = {"benchmark": name, "numMarkers": numMarkers, "numSamples": numSamples,
+                          "numFaces": len(box.faces), "time": seconds, "peakMemory": peakMemory(function, setup)}
+                results.append(report(result))
+
+    return results
+
+# Times whole runs of the simulation, recording the profiler's per-stage totals alongside the wall-clock time
+# A run stops early once every marker has hit the box, so stepsRun can be less than numSteps
+def benchmarkRuns(markerCounts, sampleCounts, stepCounts, seed = 0):
+    results = []
+
+    for numSamples in sampleCounts:
+        for numMarkers in markerCounts:
+            for numSteps in stepCounts:
+                def createSimulation():
+                    return simulation.Simulation(numMarkers = numMarkers, seed = seed, keepScenes = False,
+                                                 boxSamples = numSamples)
+
+                sim = createSimulation()
+                start = time.perf_counter()
+                profiler = sim.runSim(numSteps, verbose = False, profile = True)
+                seconds = time.perf_counter() - start
+
+                # tracemalloc slows everything down, so memory is measured on a second run with the same seed
+                memory = createSimulation().runSim(numSteps, verbose = False, profile = True,
+                                                   traceMemory = True).totals()["peakMemory"]
+
+                totals = profiler.totals()
+                result = {"benchmark": "run", "numMarkers": numMarkers, "numSamples": numSamples,
+                          "numFaces": len(sim.box.faces), "numSteps": numSteps, "stepsRun": sim.stepsRun,
+                          "time": seconds, "peakMemory": memory, "stages": totals["times"],
+                          "counters": totals["counters"]}
+                results.append(report(result))
+
+    return results
+
+# Checks that finished markers stay on the host for cracks at an angle, where smoothing used to push them back out
+# through its surface. Any marker left outside the host's bounding box is reported as a regression
+def benchmarkContainment(stepCounts, seed = 5):
+    results = []
+    crackSpecs = [
+        [{"start": [1., 2., 0.], "normal": [1., 1., 0.]}],
+        [{"start": [0., 0., 0.], "normal": [1., 2., 3.]}],
+        [{"start": [-2., 0., 0.], "normal": [1., 1., 0.]}, {"start": [2., 0., 0.], "normal": [-1., 1., 1.]}],
+    ]
+
+    for cracks in crackSpecs:
+        for numSteps in stepCounts:
+            sim = simulation.Simulation(seed = seed, keepScenes = False, cracks = cracks)
+            start = time.perf_counter()
+            sim.runSim(numSteps, verbose = False)
+            seconds = time.perf_counter() - start
+
+            summary = sim.summary()
+            result = {"benchmark": "containment", "cracks": cracks, "numSteps": numSteps, "stepsRun": sim.stepsRun,
+                      "time": seconds, "finishedMarkers": summary["finishedMarkers"],
+                      "finishedOutside": summary["finishedOutside"],
+                      "regression": summary["finishedOutside"] > 0}
+            results.append(report(result))
+
+    return results
+
+def resultKey(result):
+    return (result["benchmark"], result.get("numMarkers"), result.get("numSamples"), result.get("numSteps"),
+            json.dumps(result.get("cracks")))
+
+# Ratio of each result's time and peak memory to the matching result of an earlier run, flagging any that are
+# slower than the baseline by more than tolerance (0.1 is 10%)
+def compareToBaseline(results, baseline, tolerance = .1):
+    baseline = {resultKey(result): result for result in baseline}
+    comparisons = []
+
+    for result in results:
+        previous = baseline.get(resultKey(result))
+        if previous is None or not previous.get("time"):
+            continue
+
+        comparison = {"benchmark": result["benchmark"], "numMarkers": result.get("numMarkers"),
+                      "numSamples": result.get("numSamples"), "numSteps": result.get("numSteps"),
+                      "time": result["time"] / previous["time"]}
+        if result.get("peakMemory") and previous.get("peakMemory"):
+            comparison["peakMemory"] = result["peakMemory"] / previous["peakMemory"]
+        comparison["regression"] = comparison["time"] > 1. + tolerance
+
+        comparisons.append(comparison)
+
+    return comparisons
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmarks the stages of a simulation step and whole runs")
+    parser.add_argument("--suite", action="append", choices=["intersection", "stages", "run", "containment"],
+                        help="benchmark to run, can be given more than once (default: all of them)")
+    parser.add_argument("--samples", type=int, nargs="+",
+                        help="values of num_samples used to subdivide the host box "
+                             "(default: 1 4 16 64 128 for intersection, 1 16 for the others)")
+    parser.add_argument("--markers", type=int, nargs="+",
+                        help="numbers of markers in the crack front "
+                             "(default: 120 for intersection, 120 1000 10000 for stages, 120 1000 for runs)")
+    parser.add_argument("--steps", type=int, nargs="+", default=[25, 100],
+                        help="numbers of steps whole runs are timed for")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed repeats, the best is reported")
+    parser.add_argument("--brute-force-limit", type=int, default=200000,
+                        help="largest number of faces the brute force path is timed on")
+    parser.add_argument("--per-marker-limit", type=int, default=1000,
+                        help="largest front the one marker at a time checkIntersection loop is timed on")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the timed runs")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=.1,
+                        help="fraction slower than the baseline counted as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    suites = args.suite or ["intersection", "stages", "run", "containment"]
+    results = []
+
+    if "intersection" in suites:
+        results += benchmarkIntersection(args.samples or [1, 4, 16, 64, 128], (args.markers or [120])[0],
+                                         args.repeats, args.brute_force_limit)
+    if "stages" in suites:
+        results += benchmarkStages(args.markers or [120, 1000, 10000], args.samples or [1, 16], args.repeats,
+                                   args.per_marker_limit)
+    if "run" in suites:
+        results += benchmarkRuns(args.markers or [120, 1000], args.samples or [1, 16], args.steps, args.seed)
+    if "containment" in suites:
+        results += benchmarkContainment(args.steps)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # A finished marker outside the host is wrong whatever the baseline says
+    failed = any(result.get("regression") for result in results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparisons = compareToBaseline(results, json.load(f), args.tolerance)
+
+        for comparison in comparisons:
+            print("{:<20} markers={:<6} samples={:<4} steps={:<5} time x{:.2f}{}".format(
+                comparison["benchmark"], str(comparison["numMarkers"]), str(comparison["numSamples"]),
+                str(comparison["numSteps"]), comparison["time"], "  REGRESSION" if comparison["regression"] else ""))
+
+        failed = failed or any(comparison["regression"] for comparison in comparisons)
+
+    # A non-zero exit status lets a regression fail a script or CI job
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import numpy as np
+
+# Spreads the lower 10 bits of each value out so that there are two zero bits between each of them
+def expandBits(values):
+    values = values.astype(np.uint64)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x030000FF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x0300F00F)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x030C30C3)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x09249249)
+
+    return values
+
+# 30-bit Morton codes of points inside the box [lower, upper]
+def mortonCodes(points, lower, upper):
+    extent = np.where(upper > lower, upper - lower, 1.)
+    cells = np.clip(((points - lower) / extent) * 1023., 0., 1023.).astype(np.uint64)
+
+    return (expandBits(cells[:, 0]) << np.uint64(2)) | (expandBits(cells[:, 1]) << np.uint64(1)) | expandBits(cells[:, 2])
+
+# Bounding volume hierarchy over the triangles of a mesh
+# Triangles are sorted along a Morton curve and grouped into leaves of leafSize consecutive triangles, which are
+# the bottom level of an implicit complete binary tree. Node k has children 2k + 1 and 2k + 2, so the tree can be
+# built and traversed one level at a time with array operations instead of per-node Python code
+class BoundingVolumeHierarchy:
+    def __init__(self, vertices, faces, leafSize = 8):
+        vertices = np.asarray(vertices, dtype=float)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        corners = vertices[faces]
+
+        self.leafSize = leafSize
+        self.numFaces = len(faces)
+
+        triMin = corners.min(axis=1)
+        triMax = corners.max(axis=1)
+
+        if self.numFaces > 0:
+            centroids = corners.mean(axis=1)
+            codes = mortonCodes(centroids, centroids.min(axis=0), centroids.max(axis=0))
+            self.order = np.argsort(codes, kind='stable')
+        else:
+            self.order = np.zeros(0, dtype=np.int64)
+
+        numLeaves = max(1, -(-self.numFaces // leafSize))
+        self.depth = int(np.ceil(np.log2(numLeaves)))
+        self.firstLeaf = (1 << self.depth) - 1
+        numNodes = 2 * self.firstLeaf + 1
+
+        # Empty nodes get inverted boxes, so they never overlap anything
+        self.nodeMin = np.full((numNodes, 3), np.inf)
+        self.nodeMax = np.full((numNodes, 3), -np.inf)
+
+        if self.numFaces > 0:
+            starts = np.arange(0, self.numFaces, leafSize)
+            leaves = self.firstLeaf + np.arange(len(starts))
+            self.nodeMin[leaves] = np.minimum.reduceat(triMin[self.order], starts)
+            self.nodeMax[leaves] = np.maximum.reduceat(triMax[self.order], starts)
+
+        # Fill in the internal nodes from the bottom up
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            self.nodeMin[nodes] = np.minimum(self.nodeMin[2 * nodes + 1], self.nodeMin[2 * nodes + 2])
+            self.nodeMax[nodes] = np.maximum(self.nodeMax[2 * nodes + 1], self.nodeMax[2 * nodes + 2])
+
+    @classmethod
+    def fromMesh(cls, mesh, leafSize = 8):
+        return cls(mesh.vertices, mesh.faces, leafSize)
+
+    def toArrays(self):
+        return {"order": self.order, "nodeMin": self.nodeMin, "nodeMax": self.nodeMax,
+                "leafSize": np.array(self.leafSize), "numFaces": np.array(self.numFaces)}
+
+    # Recreates a tree from toArrays' output. The depth and first leaf follow from the number of nodes
+    @classmethod
+    def fromArrays(cls, arrays):
+        tree = cls.__new__(cls)
+        tree.order = arrays["order"]
+        tree.nodeMin = arrays["nodeMin"]
+        tree.nodeMax = arrays["nodeMax"]
+        tree.leafSize = int(arrays["leafSize"])
+        tree.numFaces = int(arrays["numFaces"])
+
+        tree.firstLeaf = (len(tree.nodeMin) - 1) // 2
+        tree.depth = (tree.firstLeaf + 1).bit_length() - 1
+
+        return tree
+
+    # Finds every triangle whose bounding box overlaps the bounding box of each segment p0[i] -> p1[i]
+    # Returns two arrays of equal length holding the segment and face index of each candidate pair
+    def querySegments(self, p0, p1):
+        p0 = np.asarray(p0, dtype=float).reshape(-1, 3)
+        p1 = np.asarray(p1, dtype=float).reshape(-1, 3)
+
+        return self.queryBoxes(np.minimum(p0, p1), np.maximum(p0, p1))
+
+    def queryBoxes(self, boxMin, boxMax):
+        segments = np.arange(len(boxMin))
+        nodes = np.zeros(len(boxMin), dtype=np.int64)
+
+        for level in range(self.depth + 1):
+            overlap = np.all((boxMin[segments] <= self.nodeMax[nodes]) & (boxMax[segments] >= self.nodeMin[nodes]), axis=1)
+            segments = segments[overlap]
+            nodes = nodes[overlap]
+
+            if level < self.depth:
+                segments = np.repeat(segments, 2)
+                nodes = np.stack((2 * nodes + 1, 2 * nodes + 2), axis=1).ravel()
+
+        # Expand each overlapping leaf into the triangles it holds
+        starts = (nodes - self.firstLeaf) * self.leafSize
+        counts = np.minimum(self.leafSize, self.numFaces - starts)
+        pairSegments = np.repeat(segments, counts)
+        offsets = np.arange(len(pairSegments)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pairFaces = self.order[np.repeat(starts, counts) + offsets]
+
+        return pairSegments, pairFaces
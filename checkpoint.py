@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import re
+import threading
+import numpy as np
+
+import crackFront as cf
+import meshBuffer as mb
+import randomStreams as rs
+import sceneData as sd
+
+# Bumped whenever what is stored changes, so checkpoints written by older code are refused rather than misread
+CHECKPOINT_VERSION = 3
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_(\d+)\.npz$")
+
+def checkpointPath(directory, step):
+    return os.path.join(directory, "checkpoint_{:06d}.npz".format(step))
+
+# Path of the checkpoint in directory taken after the most steps, or None if there is none
+def latestCheckpoint(directory):
+    paths = [path for path in glob.glob(os.path.join(directory, "checkpoint_*.npz"))
+             if CHECKPOINT_PATTERN.search(path)]
+    if not paths:
+        return None
+
+    return max(paths, key=lambda path: int(CHECKPOINT_PATTERN.search(path).group(1)))
+
+# Everything a simulation needs to carry on from where it is: each crack's front arrays, random stream state and
+# buffer index of its front's vertices, the shared mesh buffer and the size of the mesh after every step so far
+# Every array is copied, so the simulation can keep stepping while the snapshot is being written
+def capture(simulation):
+    state = {
+        "version": np.array(CHECKPOINT_VERSION),
+        "stepsRun": np.array(simulation.stepsRun),
+        "numCracks": np.array(len(simulation.cracks)),
+        "entropy": np.array(str(simulation.random.entropy)),
+        "vertices": np.copy(simulation.crackBuffer.vertices),
+        "faces": np.copy(simulation.crackBuffer.faces),
+        "tags": np.copy(simulation.crackBuffer.tags),
+        "pieces": np.copy(simulation.crackBuffer.pieces),
+        "frameCounts": np.array(simulation.frameCounts, dtype=np.int64).reshape(-1, 2),
+    }
+
+    for k, crack in enumerate(simulation.cracks):
+        prefix = "crack{}_".format(k)
+        state.update((prefix + name, np.copy(getattr(crack.front, name))) for name in cf.CrackFront.arrayNames)
+        state[prefix + "finishedMarkers"] = np.array(crack.finishedMarkers)
+        state[prefix + "rngState"] = np.array(json.dumps(crack.front.rng.bit_generator.state))
+
+        if crack.frontVertices is not None:
+            state[prefix + "frontVertices"] = np.copy(crack.frontVertices)
+
+    return state
+
+# Puts a simulation back into the state capture took. The simulation must have been created with the same options
+def restore(simulation, state):
+    if int(state["version"]) != CHECKPOINT_VERSION:
+        raise ValueError("checkpoint version {} is not supported (expected {})".format(int(state["version"]),
+                                                                                       CHECKPOINT_VERSION))
+    if int(state["numCracks"]) != len(simulation.cracks):
+        raise ValueError("checkpoint has {} cracks, but the simulation has {}".format(int(state["numCracks"]),
+                                                                                      len(simulation.cracks)))
+
+    crackBuffer = mb.MeshBuffer()
+    crackBuffer.appendVertices(state["vertices"])
+    crackBuffer.appendFaces(state["faces"], state["tags"], state["pieces"])
+    simulation.crackBuffer = crackBuffer
+
+    for k, crack in enumerate(simulation.cracks):
+        prefix = "crack{}_".format(k)
+        for name in cf.CrackFront.arrayNames:
+            setattr(crack.front, name, np.copy(state[prefix + name]))
+        crack.front.rng.bit_generator.state = json.loads(str(state[prefix + "rngState"]))
+
+        crack.meshBuffer = crackBuffer
+        crack.frontVertices = np.copy(state[prefix + "frontVertices"]) if prefix + "frontVertices" in state else None
+        crack.finishedMarkers = int(state[prefix + "finishedMarkers"])
+        crack.numMarkers = len(crack.front)
+
+    simulation.random = rs.RandomStreams(int(str(state["entropy"])))
+    simulation.stepsRun = int(state["stepsRun"])
+    simulation.frameCounts = [tuple(counts) for counts in state["frameCounts"].tolist()]
+
+def load(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+# Writes to a temporary file first so that a crash part way through a write never leaves a broken checkpoint behind
+def save(path, state):
+    tempPath = path + ".tmp.npz"
+    np.savez(tempPath, **state)
+    os.replace(tempPath, path)
+
+# The mesh only ever grows, so the scene of every step so far can be rebuilt from the restored buffer and the size
+# it had after each step
+def rebuildScenes(simulation):
+    crackBuffer = simulation.crackBuffer
+
+    return [sd.createScene(crackBuffer.vertices[:numVertices], crackBuffer.faces[:numFaces])
+            for numVertices, numFaces in simulation.frameCounts]
+
+# Saves checkpoints on a background thread, so the simulation only pays for copying its state
+# A snapshot submitted while the previous one is still being written replaces any other that is waiting, rather than
+# queueing up behind it, so a slow disk makes checkpoints less frequent instead of stalling the run
+# Only the newest keep checkpoints are left in the directory
+class CheckpointWriter(threading.Thread):
+    def __init__(self, directory, keep = 2):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closing = False
+        self.error = None
+        self.written = []
+
+        self.start()
+
+    def submit(self, state):
+        with self.condition:
+            self.pending = state
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closing:
+                    self.condition.wait()
+
+                if self.pending is None:
+                    return
+
+                state = self.pending
+                self.pending = None
+
+            try:
+                path = checkpointPath(self.directory, int(state["stepsRun"]))
+                save(path, state)
+                self.written.append(path)
+                self.removeOld()
+            except Exception as e:
+                self.error = e
+
+    def removeOld(self):
+        paths = sorted(path for path in glob.glob(os.path.join(self.directory, "checkpoint_*.npz"))
+                       if CHECKPOINT_PATTERN.search(path))
+        for path in paths[:-self.keep]:
+            os.remove(path)
+
+    # Waits for any snapshot still waiting to be written, then stops the thread
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.join()
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,206 @@
+import numpy as np
+import toughnessField as tf
+
+# Normalises each row of vectors, using the matching row of fallback for any that are zero
+def normalise(vectors, fallback):
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return np.where(lengths > 0., vectors / np.where(lengths > 0., lengths, 1.), fallback)
+
+# Dot product of each row of a with the matching row of b
+def dot(a, b):
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1] + a[:, 2] * b[:, 2]
+
+# Position of each set element of a circular mask within its run of consecutive set elements
+def runPositions(mask):
+    if mask.all():
+        return np.arange(len(mask))
+
+    # Rotate so the ring starts on an unset element, so no run wraps around the end
+    shift = np.flatnonzero(~mask)[0]
+    rotated = np.roll(mask, -shift)
+
+    indices = np.arange(len(mask))
+    runStarts = np.maximum.accumulate(np.where(~rotated, indices + 1, 0))
+
+    return np.roll(indices - runStarts, shift)
+
+# Rotation matrix taking the y-axis onto normal, by Rodrigues' formula
+def rotationFromY(normal):
+    normal = np.asarray(normal, dtype=float)
+    normal = normal / np.linalg.norm(normal)
+    yAxis = np.array([0., 1., 0.])
+
+    axis = np.cross(yAxis, normal)
+    sinAngle = np.linalg.norm(axis)
+    cosAngle = np.dot(yAxis, normal)
+
+    if sinAngle < 1e-12:
+        # Already the y-axis, or its opposite, which is half a turn about the x-axis
+        return np.eye(3) if cosAngle > 0. else np.diag([1., -1., -1.])
+
+    axis /= sinAngle
+    k = np.array([[0., -axis[2], axis[1]],
+                  [axis[2], 0., -axis[0]],
+                  [-axis[1], axis[0], 0.]])
+
+    return np.eye(3) + sinAngle * k + (1. - cosAngle) * (k @ k)
+
+class CrackFront:
+    def __init__(self, locations, directions, moveSpeed = .095, rng = None):
+        locations = np.array(locations, dtype=float).reshape(-1, 3)
+        directions = np.array(directions, dtype=float).reshape(-1, 3)
+
+        # Every per-marker quantity lives in one contiguous array so the whole front can be stepped at once
+        self.currLocations = np.copy(locations)
+        self.prevLocations = np.copy(locations)
+        self.directions = directions
+        self.normals = np.tile(np.array([0., 1., 0.]), (len(locations), 1))
+        self.moveSpeeds = np.full(len(locations), moveSpeed)
+        self.finished = np.zeros(len(locations), dtype=bool)
+
+        # numpy Generator the perturbations are drawn from
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def __len__(self):
+        return len(self.currLocations)
+
+    # Per-marker arrays, which must all be resized together when markers are inserted or removed
+    arrayNames = ("currLocations", "prevLocations", "directions", "normals", "moveSpeeds", "finished")
+
+    # Creates a front of numMarkers markers starting at the same location, with directions evenly spread around
+    # the y-axis, or around normal if given, in which case the markers' normals point along it too
+    @classmethod
+    def ring(cls, startLocation, numMarkers, moveSpeed = .095, rng = None, normal = None):
+        theta = np.radians(360. / numMarkers) * np.arange(numMarkers)
+        directions = np.stack((np.cos(theta), np.zeros(numMarkers), -np.sin(theta)), axis=1)
+        locations = np.tile(np.array(startLocation, dtype=float), (numMarkers, 1))
+
+        if normal is None:
+            return cls(locations, directions, moveSpeed, rng)
+
+        rotation = rotationFromY(normal)
+        front = cls(locations, directions @ rotation.T, moveSpeed, rng)
+        front.normals = front.normals @ rotation.T
+
+        return front
+
+    # Advances every marker in indices (all unfinished markers by default) by one step
+    def propagate(self, lowToughnessAreas, initCrack, indices = None):
+        if indices is None:
+            indices = np.flatnonzero(~self.finished)
+
+        if initCrack:
+            rng = np.zeros(len(indices))
+        else:
+            # Always draw for the whole front, so the stream advances the same way whichever markers are active
+            rng = self.rng.uniform(.15, 1., len(self))[indices]
+
+        rng *= self.calcMovementWeights(lowToughnessAreas, indices)
+
+        self.prevLocations[indices] = self.currLocations[indices]
+
+        # Ensure energy conservation
+        speeds = self.moveSpeeds[indices, np.newaxis]
+        rng = rng[:, np.newaxis]
+        forwardSpeed = speeds * self.directions[indices] * (1. - np.abs(rng))
+        normalSpeed = rng * speeds * self.normals[indices]
+
+        self.currLocations[indices] += forwardSpeed + normalSpeed
+
+        return indices
+
+    # Resamples the ring so that the distance between adjacent markers stays between minSpacing and maxSpacing
+    # A marker closer than minSpacing to the one before it is merged into it, and a new marker is inserted halfway
+    # between any two further apart than maxSpacing. Either bound can be None to skip that half
+    # Returns, for each marker of the new ring, the index it had before, or -1 if it was inserted
+    def resample(self, maxSpacing = None, minSpacing = None):
+        sources = np.arange(len(self))
+
+        if minSpacing is not None and len(self) > 3:
+            spacing = np.linalg.norm(self.currLocations - np.roll(self.currLocations, 1, axis=0), axis=1)
+            tooClose = (spacing < minSpacing) & (self.finished == np.roll(self.finished, 1))
+
+            # Never remove two neighbours at once, or the ring could open a gap wider than it closes, so only every
+            # other marker of a run that is too close together goes
+            remove = tooClose & (runPositions(tooClose) % 2 == 0)
+            if np.count_nonzero(~remove) < 3:
+                remove[:] = False
+
+            keep = ~remove
+            for name in self.arrayNames:
+                setattr(self, name, getattr(self, name)[keep])
+            sources = sources[keep]
+
+        if maxSpacing is not None and len(self) > 0:
+            nextMarkers = np.roll(np.arange(len(self)), -1)
+            spacing = np.linalg.norm(self.currLocations[nextMarkers] - self.currLocations, axis=1)
+            split = np.flatnonzero(spacing > maxSpacing)
+            after = nextMarkers[split]
+
+            if len(split) > 0:
+                directions = self.directions[split] + self.directions[after]
+                directions = normalise(directions, self.directions[split])
+                normals = normalise(self.normals[split] + self.normals[after], self.normals[split])
+
+                inserted = {
+                    "currLocations": (self.currLocations[split] + self.currLocations[after]) / 2.,
+                    "prevLocations": (self.prevLocations[split] + self.prevLocations[after]) / 2.,
+                    "directions": directions,
+                    "normals": normals,
+                    "moveSpeeds": (self.moveSpeeds[split] + self.moveSpeeds[after]) / 2.,
+                    "finished": self.finished[split] & self.finished[after],
+                }
+
+                for name in self.arrayNames:
+                    setattr(self, name, np.insert(getattr(self, name), split + 1, inserted[name], axis=0))
+                sources = np.insert(sources, split + 1, -1)
+
+        return sources
+
+    # Circular convolution of each marker's height along its normal (its y-coordinate for a horizontal crack) around
+    # the ring with a kernel of width markers centred on each one
+    # Finished markers can be left where they intersected the mesh, while still contributing to their neighbours
+    # Finished markers whose normal isn't the y-axis are always left there, as moving them along a tilted normal
+    # would push them off the face they hit and out through the surface of the mesh. Moving along the y-axis keeps
+    # a marker on the vertical walls of the box, which is how a horizontal crack has always been smoothed
+    def smooth(self, width = 5, iterations = 3, weights = None, skipFinished = False):
+        if width % 2 == 0:
+            raise ValueError("smoothing width must be odd, got {}".format(width))
+
+        if weights is None:
+            weights = np.ones(width)
+
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) != width:
+            raise ValueError("expected {} smoothing weights, got {}".format(width, len(weights)))
+
+        weights = weights / weights.sum()
+        offsets = np.arange(width) - width // 2
+        heights = dot(self.currLocations, self.normals)
+        y = heights
+
+        onYAxis = (self.normals[:, 0] == 0.) & (self.normals[:, 2] == 0.)
+        held = self.finished if skipFinished else self.finished & ~onYAxis
+
+        for i in range(iterations):
+            smoothed = np.zeros(len(y))
+            for offset, weight in zip(offsets, weights):
+                smoothed += weight * np.roll(y, -offset)
+
+            smoothed[held] = y[held]
+            y = smoothed
+
+        # Taking the old height off before adding the new one leaves a y-coordinate set to exactly the smoothed value
+        # when the normal is the y-axis
+        moving = ~held
+        self.currLocations[moving] = (self.currLocations[moving] - heights[moving, np.newaxis] * self.normals[moving]) \
+                                     + y[moving, np.newaxis] * self.normals[moving]
+
+    # Each marker is pulled along its normal towards weaker material, more strongly the closer it is
+    # lowToughnessAreas is either a list of heights of low toughness planes or a toughness model such as a
+    # toughnessField.ToughnessField
+    def calcMovementWeights(self, lowToughnessAreas, indices):
+        toughness = tf.asToughness(lowToughnessAreas)
+
+        return toughness.movementWeights(self.currLocations[indices], self.normals[indices])
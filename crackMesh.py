@@ -1,246 +1,248 @@
 import numpy as np
 import marker as m
+import crackFront as cf
+import intersection as ix
+import meshBuffer as mb
+import profiler as pf
 import pymesh
 
+# Faces of the slab between the previous and current front for each marker in quads and the marker after it, given
+# the vertex index of every marker's current/previous top and bottom vertices
+def stripFaces(currTop, prevTop, currBottom, prevBottom, quads):
+    nextQuads = (quads + 1) % len(currTop)
+
+    i1, i2, i3, i4 = currTop[quads], prevTop[quads], currTop[nextQuads], prevTop[nextQuads]
+    i5, i6, i7, i8 = currBottom[quads], prevBottom[quads], currBottom[nextQuads], prevBottom[nextQuads]
+
+    faces = np.stack((
+        (i4, i3, i2), (i3, i1, i2),     # Top
+        (i7, i8, i6), (i5, i7, i6),     # Bottom
+        (i1, i5, i7), (i1, i7, i3),     # Current front
+        (i4, i8, i6), (i2, i4, i6),     # Previous front
+        (i5, i1, i6), (i2, i6, i1),     # Side of this marker
+        (i3, i7, i4), (i7, i8, i4),     # Side of the next marker
+    ))
+
+    # (face, corner, quad) -> one row per face, grouped by quad
+    return faces.transpose(2, 0, 1).reshape(-1, 3)
+
+# Merges vertices with identical coordinates, keeping the first occurrence of each in its original order
+def weldVertices(vertices, faces):
+    unique, first, inverse = np.unique(vertices, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    remap = np.empty(len(order), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+
+    return vertices[first[order]], remap[inverse.ravel()][faces]
+
+# Which faces use the same vertex more than once
+def collapsedFaces(faces):
+    return (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+
+# Drops faces that use the same vertex more than once
+def removeCollapsedFaces(faces):
+    return faces[~collapsedFaces(faces)]
+
 class CrackMesh:
-    def __init__(self, startLocation):
-        self.markers = []        
-        self.numMarkers = 120
-
-        direction = np.array([1.0, 0.0, 0.0])
-        
-        # Rotate the direction of the vector relative to the initial number of markers being used
-        theta = np.radians(360. / self.numMarkers)
+    def __init__(self, startLocation, numMarkers = 120, rng = None, normal = None, meshBuffer = None, tag = 0):
+        self.numMarkers = numMarkers
+        self.moveSpeed = .095
+
+        # Directions are evenly rotated around the y-axis, or the crack's normal if given, relative to the initial
+        # number of markers being used
+        self.front = cf.CrackFront.ring(startLocation, self.numMarkers, self.moveSpeed, rng, normal)
+        self.markers = m.MarkerList(self.front)
         self.finishedMarkers = 0
-        
-        for i in range(self.numMarkers):
-            marker = m.Marker(startLocation, direction)
-            self.markers.append(marker)
-            
-            c, s = np.cos(theta), np.sin(theta)
-            R = np.array(((c, 0., s), (0., 1., 0.), (-s, 0., c)))
-            
-            direction = np.matmul(R, direction)
+
+        # The whole crack mesh, grown by one strip per step. frontVertices holds the buffer index of each marker's
+        # latest top and bottom vertex, which the next strip shares instead of duplicating
+        # Several cracks can share one buffer, with each face tagged with the crack it belongs to
+        self.offset = 0.05
+        self.meshBuffer = meshBuffer if meshBuffer is not None else mb.MeshBuffer()
+        self.tag = tag
+        self.frontVertices = None
+
+        # Optional signed distance field of the host mesh. When set, only markers that end a step close to the
+        # surface are tested against its triangles, and with adaptiveStep markers far from it take longer steps
+        self.distanceField = None
+        self.adaptiveStep = False
+        self.maxSpeedScale = 4.
+
+        # Smoothing kernel applied around the front after every step. Weights default to a plain average
+        self.smoothingWidth = 5
+        self.smoothingIterations = 3
+        self.smoothingWeights = None
+        self.smoothingSkipFinished = False
+
+        # Receives per-stage timings and counters when the simulation is being profiled
+        self.profiler = pf.NULL_PROFILER
+
+        # Adaptive resampling of the front, off unless a spacing is set
+        self.maxSpacing = None
+        self.minSpacing = None
             
     def propagateCrackFront(self, mesh, lowToughnessAreas, initCrack):
-        for marker in self.markers:
-            # Only propagate markers that have not intersected with the mesh
-            if not marker.finished:
-                marker.propagate(lowToughnessAreas, initCrack)
-                iPoint, intersection = self.checkIntersection(marker, mesh)
-                
-                if intersection:
-                    marker.finished = True
-                    self.finishedMarkers += 1
-                    marker.currLocation = iPoint
-                
-        self.smoothMesh()
-                    
+        active = self.advance(lowToughnessAreas, initCrack)
+
+        with self.profiler.stage("intersection"):
+            hits, points = self.checkIntersections(mesh, active)
+        self.finishMarkers(active, hits, points)
+
+        # Smoothing moves markers too, so those moves have to be tested as well or a marker could be pushed through
+        # the mesh without ever hitting it
+        unfinished, smoothedFrom = self.smoothFront()
+        with self.profiler.stage("intersection"):
+            hits, points = self.getIntersector(mesh).intersect(smoothedFrom, self.front.currLocations[unfinished])
+        self.finishMarkers(unfinished, hits, points)
+
+    # Moves every unfinished marker on by one step and returns the ones whose step has to be tested against the mesh
+    def advance(self, lowToughnessAreas, initCrack):
+        profiler = self.profiler
+
+        if self.distanceField is not None and self.adaptiveStep:
+            with profiler.stage("distanceField"):
+                unfinished = np.flatnonzero(~self.front.finished)
+                self.front.moveSpeeds[unfinished] = self.distanceField.safeSpeeds(
+                    self.front.currLocations[unfinished], self.moveSpeed, self.moveSpeed * self.maxSpeedScale)
+
+        # Only propagate markers that have not intersected with the mesh, advancing them all in one batch
+        with profiler.stage("propagation"):
+            active = self.front.propagate(lowToughnessAreas, initCrack)
+        profiler.count("activeMarkers", len(active))
+
+        if self.distanceField is not None:
+            with profiler.stage("distanceField"):
+                active = active[self.distanceField.nearSurface(self.front.prevLocations[active],
+                                                               self.front.currLocations[active])]
+
+        return active
+
+    # Stops the markers in active whose step hit the mesh at the point they hit it
+    def finishMarkers(self, active, hits, points):
+        finished = active[hits]
+        self.front.finished[finished] = True
+        self.front.currLocations[finished] = points[hits]
+        self.finishedMarkers += len(finished)
+        self.profiler.count("intersections", len(finished))
+
+    # Smooths the front, returning the unfinished markers and where they were before, so their moves can be tested
+    def smoothFront(self):
+        unfinished = np.flatnonzero(~self.front.finished)
+        smoothedFrom = self.front.currLocations[unfinished]
+
+        with self.profiler.stage("smoothing"):
+            self.smoothMesh()
+
+        if self.distanceField is not None:
+            with self.profiler.stage("distanceField"):
+                near = self.distanceField.nearSurface(smoothedFrom, self.front.currLocations[unfinished])
+                unfinished, smoothedFrom = unfinished[near], smoothedFrom[near]
+
+        return unfinished, smoothedFrom
+
+    @property
+    def isFinished(self):
+        return self.finishedMarkers >= len(self.front)
+
+    # Inserts markers where the front has spread out and merges markers that have bunched up, keeping the spacing
+    # between neighbours between minSpacing and maxSpacing. Inserted markers start a new vertex in the mesh buffer
+    # at their location, so the next strip joins up with them
+    def refineFront(self):
+        if self.maxSpacing is None and self.minSpacing is None:
+            return
+
+        with self.profiler.stage("refinement"):
+            sources = self.front.resample(self.maxSpacing, self.minSpacing)
+        self.numMarkers = len(self.front)
+        self.finishedMarkers = int(np.count_nonzero(self.front.finished))
+
+        if self.frontVertices is not None:
+            inserted = np.flatnonzero(sources < 0)
+            frontVertices = self.frontVertices[np.maximum(sources, 0)]
+
+            down = self.offset * self.front.normals[inserted]
+            frontVertices[inserted, 0] = self.meshBuffer.appendVertices(self.front.currLocations[inserted])
+            frontVertices[inserted, 1] = self.meshBuffer.appendVertices(self.front.currLocations[inserted] - down)
+
+            self.frontVertices = frontVertices
+
     # Averages out the y-coordinates of adjacent markers, in order to mitigate the randomness and smooth the mesh
-    # Finds the previous two markers and the next two markers, and averages the y-coordinates of all 5 markers
+    # By default each marker is averaged with the previous two markers and the next two markers, three times over
     def smoothMesh(self):
-        yVals = []
-        for i in range(3):
-            for j in range(len(self.markers)):
-                if j == 0:
-                    backIndex = self.numMarkers - 2
-                elif j == 1:
-                    backIndex = self.numMarkers - 1
-                else:
-                    backIndex = j - 2
-                    
-                yVals.append(self.markers[backIndex].currLocation[1])
-                yVals.append(self.markers[(backIndex + 1) % self.numMarkers].currLocation[1])
-                yVals.append(self.markers[(j + 1) % self.numMarkers].currLocation[1])
-                yVals.append(self.markers[(j + 2) % self.numMarkers].currLocation[1])
-                
-                markerToSmooth = self.markers[j]
-                yVals.append(markerToSmooth.currLocation[1])
-
-                
-                markerToSmooth.currLocation[1] = sum(yVals) / len(yVals)
+        self.front.smooth(self.smoothingWidth, self.smoothingIterations, self.smoothingWeights,
+                          self.smoothingSkipFinished)
                     
+    # Creates a thin slab between the previous and current crack front, offset by offset against each marker's normal
+    # (downwards for a horizontal crack)
+    # Vertices are laid out arithmetically from the ring topology: current top, previous top, current bottom and
+    # previous bottom for each marker. Coincident vertices are then welded, and faces that collapse are dropped
     def createCrackMesh(self):
-        vertices = []
-        faces = []
-        offset = 0.05
-        # Use adjacent markers to create triangles
-        for i in range(self.numMarkers):
-            marker = self.markers[i]
-            nextMarker = self.markers[(i + 1) % self.numMarkers]
-            
-            v1 = marker.currLocation
-            v2 = marker.prevLocation
-            v3 = nextMarker.currLocation
-            v4 = nextMarker.prevLocation
-                       
-            v5 = np.copy(marker.currLocation)
-            v5[1] -= offset
-            
-            v6 = np.copy(marker.prevLocation)
-            v6[1] -= offset
-            
-            v7 = np.copy(nextMarker.currLocation)
-            v7[1] -= offset
-            
-            v8 = np.copy(nextMarker.prevLocation)
-            v8[1] -= offset
-            
-            i1 = self.findIndexOfVertex(vertices, v1)
-            
-            if i1 == -1:
-                i1 = len(vertices)
-                vertices.append(v1)
-                
-            i2 = self.findIndexOfVertex(vertices, v2)
-                
-            if i2 == -1:
-                i2 = len(vertices)
-                vertices.append(v2)
-                
-            i3 = self.findIndexOfVertex(vertices, v3)
-            
-            if i3 == -1:
-                i3 = len(vertices)
-                vertices.append(v3)
-                
-            i4 = self.findIndexOfVertex(vertices, v4)
-                
-            if i4 == -1:
-                i4 = len(vertices)
-                vertices.append(v4)
-                
-            i5 = self.findIndexOfVertex(vertices, v5)
-            
-            if i5 == -1:
-                i5 = len(vertices)
-                vertices.append(v5)
-                
-            i6 = self.findIndexOfVertex(vertices, v6)
-                
-            if i6 == -1:
-                i6 = len(vertices)
-                vertices.append(v6)
-                
-            i7 = self.findIndexOfVertex(vertices, v7)
-            
-            if i7 == -1:
-                i7 = len(vertices)
-                vertices.append(v7)
-                
-            i8 = self.findIndexOfVertex(vertices, v8)
-                
-            if i8 == -1:
-                i8 = len(vertices)
-                vertices.append(v8)
-                
-            f1 = [i4, i3, i2]
-            f2 = [i3, i1, i2]
-            
-            f3 = [i7, i8, i6]
-            f4 = [i5, i7, i6]
-            
-            f5 = [i1, i5, i7]
-            f6 = [i1, i7, i3]
-            
-            f7 = [i4, i8, i6]
-            f8 = [i2, i4, i6]
-            
-            f9 = [i5, i1, i6]
-            f10 = [i2, i6, i1]
-            
-            f11 = [i3, i7, i4]
-            f12 = [i7, i8, i4]
-            
-            faces.append(f1)
-            faces.append(f2)
-            
-            faces.append(f3)
-            faces.append(f4)
-            
-            faces.append(f5)
-            faces.append(f6)
-            
-            faces.append(f7)
-            faces.append(f8)
-            
-            faces.append(f9)
-            faces.append(f10)
-            
-            faces.append(f11)
-            faces.append(f12)
-        
-        return vertices, faces
+        numMarkers = len(self.front)
+        ring = np.arange(numMarkers)
+
+        down = self.offset * self.front.normals
+        vertices = np.concatenate((self.front.currLocations, self.front.prevLocations,
+                                   self.front.currLocations - down, self.front.prevLocations - down))
+
+        faces = stripFaces(ring, ring + numMarkers, ring + 2 * numMarkers, ring + 3 * numMarkers, ring)
+
+        vertices, faces = weldVertices(vertices, faces)
+
+        return vertices, removeCollapsedFaces(faces)
+
+    # Appends the strip between the front as it was when this was last called and the current front to meshBuffer
+    # Only markers that have moved since then get new vertices, and only quads touching them get new faces
+    def appendToMeshBuffer(self):
+        numMarkers = len(self.front)
+        down = self.offset * self.front.normals
+
+        if self.frontVertices is None:
+            # The first ring usually sits on a single point, so weld it before adding it
+            ring = np.arange(numMarkers)
+            vertices, indices = weldVertices(np.concatenate((self.front.prevLocations, self.front.prevLocations - down)),
+                                             np.stack((ring, ring + numMarkers), axis=1))
+            self.frontVertices = self.meshBuffer.appendVertices(vertices)[indices]
+
+        moved = np.flatnonzero(np.any(self.meshBuffer.vertices[self.frontVertices[:, 0]] != self.front.currLocations,
+                                      axis=1))
+        if len(moved) == 0:
+            return
+
+        prevTop = self.frontVertices[:, 0]
+        prevBottom = self.frontVertices[:, 1]
+        currTop = np.copy(prevTop)
+        currBottom = np.copy(prevBottom)
+
+        currTop[moved] = self.meshBuffer.appendVertices(self.front.currLocations[moved])
+        currBottom[moved] = self.meshBuffer.appendVertices(self.front.currLocations[moved] - down[moved])
+
+        # Every quad with at least one moved corner. Each quad's faces close off a slab of their own, so they are
+        # added as one piece
+        quads = np.union1d(moved, (moved - 1) % numMarkers)
+        faces = stripFaces(currTop, prevTop, currBottom, prevBottom, quads)
+        pieces = np.repeat(np.arange(len(quads)), len(faces) // len(quads))
+        kept = ~collapsedFaces(faces)
+        self.meshBuffer.appendFaces(faces[kept], self.tag, pieces[kept])
+
+        self.frontVertices = np.stack((currTop, currBottom), axis=1)
     
-    def findIndexOfVertex(self, vertices, vertex):
-        index = -1
-        for i in range(len(vertices)):
-            if np.array_equal(vertices[i], vertex):
-                index = i
-                
-        return index
-            
     # Neither PyMesh nor Pyassimp provide a line-mesh intersection method, so have to implement our own
-    # Based on the algorithm found at http://geomalgorithms.com/a06-_intersect-2.html#intersect3D_RayTriangle()
+    # The per-triangle data is cached on the intersector, so pass one in rather than a mesh where possible
+    def getIntersector(self, mesh):
+        if isinstance(mesh, ix.TriangleIntersector):
+            return mesh
+
+        return ix.TriangleIntersector.fromMesh(mesh)
+
+    # Tests the last step of every marker in indices against the mesh in one batch
+    def checkIntersections(self, mesh, indices):
+        intersector = self.getIntersector(mesh)
+        result = intersector.intersect(self.front.prevLocations[indices], self.front.currLocations[indices])
+        self.profiler.count("trianglesTested", intersector.lastPairsTested)
+
+        return result
+
     def checkIntersection(self, marker, mesh):
-        SMALL_NUM = 0.000001 # Tolerance for floats
-        isectPoint = np.zeros(3)
-        intersection = False
-        
-        p0 = marker.prevLocation
-        p1 = marker.currLocation
-        
-        # Segment direction vector
-        dir = p1 - p0
-        
-        for face in mesh.faces:
-            v0 = mesh.vertices[face[0]]
-            v1 = mesh.vertices[face[1]]
-            v2 = mesh.vertices[face[2]]
-            
-            # Get triangle edge vectors and plane normal
-            u = v1 - v0
-            v = v2 - v0
-            n = np.cross(u, v)
-            if np.count_nonzero(n) == 0:     # Triangle is degenerate
-                continue                     # Do not deal with this case
-
-            w0 = p0 - v0
-            a = -np.dot(n,w0)
-            b = np.dot(n,dir)
-            
-            if abs(b) < SMALL_NUM:        # Ray is parallel to triangle plane or lies in the plane
-                continue
+        hits, points = self.checkIntersections(mesh, np.array([marker.index]))
 
-            # Get intersect point of ray with triangle plane
-            r = a / b;
-            
-            if r < 0.0:                     # Triangle is behind the segment's p0 if (r < 0.0)
-                continue                    # Therefore no intersection
-            elif r > 1.0:                   # For a segment, also test if (r > 1.0)
-                continue                    # Triangle is past segment's p1 => no intersect
-            
-            isectPoint = p0 + (r * dir)     # Intersect point of segment and plane
-        
-            # Is isectPoint inside the triangle?
-            uu = np.dot(u,u);
-            uv = np.dot(u,v);
-            vv = np.dot(v,v);
-            w = isectPoint - v0;
-            wu = np.dot(w,u);
-            wv = np.dot(w,v);
-            D = uv * uv - uu * vv;
-        
-            # get and test parametric coords
-            s = (uv * wv - vv * wu) / D;
-            if (s < 0.0 or s > 1.0):        # isectPoint is outside T?
-                continue
-            
-            t = (uv * wu - uu * wv) / D;
-            if (t < 0.0 or (s + t) > 1.0):   # isectPoint is outside T?
-                continue
-            
-            intersection = True
-            break
-        
-        return isectPoint, intersection
\ No newline at end of file
+        return points[0], bool(hits[0])
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import numpy as np
+import pymesh
+
+import voxelGrid as vg
+
+# Signed distance to the surface of a mesh, sampled on a regular voxel grid and read back with trilinear
+# interpolation. Distances are negative inside the mesh, as PyMesh returns them
+class SignedDistanceField:
+    def __init__(self, distances, origin, spacing):
+        self.distances = np.asarray(distances, dtype=float)
+        self.origin = np.asarray(origin, dtype=float)
+        self.spacing = np.asarray(spacing, dtype=float)
+
+        # The true distance is 1-Lipschitz, so interpolating it is never further off than one cell diagonal
+        self.errorMargin = float(np.linalg.norm(self.spacing))
+
+    # Samples the distance to the mesh at resolution points along each axis of its bounding box, padded by two cells
+    # so every grid border lies outside the mesh
+    @classmethod
+    def fromMesh(cls, mesh, resolution = 64):
+        lower = mesh.vertices.min(axis=0)
+        upper = mesh.vertices.max(axis=0)
+        spacing = (upper - lower) / (resolution - 5)
+        origin = lower - 2. * spacing
+
+        axes = [origin[i] + spacing[i] * np.arange(resolution) for i in range(3)]
+        points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        distances, faces, closestPoints = pymesh.signed_distance_to_mesh(mesh, points)[:3]
+
+        return cls(distances.reshape(resolution, resolution, resolution), origin, spacing)
+
+    # Loads the field for this mesh from cacheDir, baking and storing it there first if it is not already cached
+    @classmethod
+    def cached(cls, mesh, cacheDir, resolution = 64):
+        key = hashlib.sha1()
+        key.update(np.ascontiguousarray(mesh.vertices, dtype=float).tobytes())
+        key.update(np.ascontiguousarray(mesh.faces, dtype=np.int64).tobytes())
+        key.update(str(resolution).encode())
+        path = os.path.join(cacheDir, "sdf_{}.npz".format(key.hexdigest()))
+
+        if os.path.exists(path):
+            return cls.load(path)
+
+        field = cls.fromMesh(mesh, resolution)
+        os.makedirs(cacheDir, exist_ok=True)
+        field.save(path)
+
+        return field
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["distances"], data["origin"], data["spacing"])
+
+    # Writes to a temporary file first so that an interrupted save never leaves a broken cache entry behind
+    def save(self, path):
+        tempPath = path + ".tmp.npz"
+        np.savez(tempPath, distances=self.distances, origin=self.origin, spacing=self.spacing)
+        os.replace(tempPath, path)
+
+    # Trilinearly interpolated distance at each point. Points outside the grid are clamped to it, and the distance
+    # to the grid is added on, which keeps the result an upper bound
+    def sample(self, points):
+        values, gradients, offsets = vg.trilinear(self.distances, self.origin, self.spacing, points)
+
+        return values + np.linalg.norm(offsets, axis=1)
+
+    # Markers whose last step could have crossed the surface: anything not safely inside by more than its step length
+    def nearSurface(self, prevLocations, currLocations):
+        stepLengths = np.linalg.norm(currLocations - prevLocations, axis=1)
+
+        return self.sample(currLocations) > -(stepLengths + self.errorMargin)
+
+    # Largest step each marker can take without reaching the surface, never less than minSpeed or more than maxSpeed
+    def safeSpeeds(self, locations, minSpeed, maxSpeed):
+        return np.clip(-self.sample(locations) - self.errorMargin, minSpeed, maxSpeed)
@@ -1,4 +1,7 @@
 import sys
+import os
+import argparse
+import tempfile
 import numpy as np
 import math
 
@@ -10,11 +13,13 @@ import OpenGL.GLU as glu
 import OpenGL.GLUT as glut
 from OpenGL.arrays import vbo
 from OpenGL.GL import shaders
-from pyassimp import *
-from pyassimp.helper import *
 
 import simulation
+import frameStore
+import gpuBufferCache
+import simulationWorker
 import defaultCamera
+import profiler as pf
 
 width, height= 1024, 768
 viewport = (width, height)
@@ -41,28 +46,53 @@ def render(scene, wireframe = False, twosided = False):
     gl.glUniform4f(shader.Light_diffuse, 0.77,0.8,1.,1.0)
     gl.glUniform3f(shader.Light_location, 1,5,10)
 
-    recursive_render(scene.rootnode, shader)
+    if getattr(scene, "draw_list", None) is None:
+        compile_scene(scene, shader)
 
+    for item in scene.draw_list:
+        gl.glUniform4f(shader.Material_diffuse, *item["diffuse"])
+        gl.glUniform4f(shader.Material_ambient, *item["ambient"])
+
+        gl.glBindVertexArray(item["vao"])
+
+        if item["model"] is None:
+            gl.glDrawElements(gl.GL_TRIANGLES, item["count"], gl.GL_UNSIGNED_INT, None)
+        else:
+            gl.glPushMatrix()
+            gl.glMultMatrixf(item["model"])
+            gl.glDrawElements(gl.GL_TRIANGLES, item["count"], gl.GL_UNSIGNED_INT, None)
+            gl.glPopMatrix()
+
+    gl.glBindVertexArray(0)
     gl.glUseProgram(0)
     
-def recursive_render(node, shader):
-    """ Main recursive rendering method.
+def compile_scene(scene, shader):
+    """ Flattens the scene's node tree into a draw list, so rendering it only binds and draws.
+    Each mesh gets a vertex array object with its attribute pointers and index buffer baked in, the combined
+    transformation of its nodes and its material colours. The meshes' GL buffers must already be prepared.
     """
-    # save model matrix and apply node transformation
-    gl.glPushMatrix()
-    m = node.transformation.transpose() # OpenGL row major
-    gl.glMultMatrixf(m)
+    scene.draw_list = []
+    compile_node(scene, scene.rootnode, np.identity(4), shader)
+
+def compile_node(scene, node, parent_transformation, shader):
+    transformation = np.dot(parent_transformation, node.transformation)
+
+    # OpenGL is column major. Identity transformations are skipped when drawing
+    if np.allclose(transformation, np.identity(4)):
+        model = None
+    else:
+        model = np.ascontiguousarray(transformation.transpose(), dtype=np.float32)
 
     for mesh in node.meshes:
         stride = 24 # 6 * 4 bytes
 
-        diffuse = mesh.material.properties["diffuse"]
+        diffuse = list(mesh.material.properties["diffuse"])
         if len(diffuse) == 3: diffuse.append(1.0)
-        ambient = mesh.material.properties["ambient"]
+        ambient = list(mesh.material.properties["ambient"])
         if len(ambient) == 3: ambient.append(1.0)
 
-        gl.glUniform4f(shader.Material_diffuse, *diffuse)
-        gl.glUniform4f(shader.Material_ambient, *ambient)
+        vao = gl.glGenVertexArrays(1)
+        gl.glBindVertexArray(vao)
 
         vbo = mesh.gl["vbo"]
         vbo.bind()
@@ -81,19 +111,23 @@ def recursive_render(node, shader):
        )
 
         gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, mesh.gl["faces"])
-        gl.glDrawElements(gl.GL_TRIANGLES, len(mesh.faces) * 3, gl.GL_UNSIGNED_INT, None)
 
+        # Unbind the vertex array first, so it keeps its index buffer binding
+        gl.glBindVertexArray(0)
         vbo.unbind()
-        gl.glDisableVertexAttribArray(shader.Vertex_position)
-
-        gl.glDisableVertexAttribArray(shader.Vertex_normal)
-
         gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, 0)
 
-    for child in node.children:
-        recursive_render(child, shader)
+        mesh.gl["vao"] = vao
+        scene.draw_list.append({
+            "vao": vao,
+            "count": len(mesh.faces) * 3,
+            "model": model,
+            "diffuse": tuple(diffuse),
+            "ambient": tuple(ambient),
+        })
 
-    gl.glPopMatrix()
+    for child in node.children:
+        compile_node(scene, child, transformation, shader)
 
 def prepare_gl_buffers(mesh):
         mesh.gl = {}
@@ -112,6 +146,22 @@ def prepare_gl_buffers(mesh):
                     gl.GL_STATIC_DRAW)
         gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER,0)
     
+def release_gl_buffers(mesh):
+        if "vao" in mesh.gl:
+            gl.glDeleteVertexArrays(1, [mesh.gl["vao"]])
+        mesh.gl["vbo"].delete()
+        gl.glDeleteBuffers(1, [mesh.gl["faces"]])
+        mesh.gl = {}
+
+def prepare_scene(scene):
+    for mesh in scene.meshes:
+        prepare_gl_buffers(mesh)
+
+def release_scene(scene):
+    for mesh in scene.meshes:
+        release_gl_buffers(mesh)
+    scene.draw_list = None
+    
 def set_shader_accessors(uniforms, attributes, shader):
     # add accessors to the shaders uniforms and attributes
     for uniform in uniforms:
@@ -216,6 +266,10 @@ def set_camera_projection(camera = None):
     gl.glLoadIdentity()
 
 
+# Applies a 4x4 transformation matrix to a 3D point, as pyassimp.helper.transform did
+def transform(point, matrix):
+    return np.dot(matrix, np.append(np.asarray(point, dtype=float), 1.))[:3]
+
 def set_camera(camera):
     set_camera_projection(camera)
 
@@ -265,36 +319,125 @@ def loop():
 
     return True
     
-#---------Execution----------  
-if len(sys.argv) < 2:
-    numSteps = 100
-else:
-    numSteps = int(sys.argv[1])
-    
-simulation = simulation.Simulation()
-simulation.runSim(numSteps)
+def view(scenes, vram_budget = 256 * 1024 * 1024, prefetch = 4, worker = None, profile_path = None):
+    """ Plays back the scenes in a loop. With a worker, scenes is a frameStore.FrameStoreReader over the store the
+    worker's simulation writes to, refreshed as it finishes each step, and playback follows the newest step until
+    the simulation is done.
+    With profile_path, the time of every frame and the time spent uploading and drawing within it are written
+    there (.json or .csv) when the viewer is closed.
+    """
+    global clock
 
-initViewer()
+    initViewer()
 
-scenes = simulation.scenes
-for scene in scenes:
-    for index, mesh in enumerate(scene.meshes):
-        prepare_gl_buffers(mesh)
+    # Frames are uploaded when playback reaches them and released again once over budget, so startup doesn't
+    # depend on the length of the run
+    buffers = gpuBufferCache.GpuBufferCache(scenes, prepare_scene, release_scene, vram_budget, prefetch)
 
-curr_scene = -1
-extra_frames = 0
+    running = worker is not None
 
-clock = pygame.time.Clock()
+    if running:
+        worker.start()
 
-while loop():
-    curr_scene = min(curr_scene + 1, len(scenes) - 1)
-    scene = scenes[curr_scene]
-    
-    render(scene, wireframe)
-    
-    if curr_scene == len(scenes) -1:
-        extra_frames += 1
+    clock = pygame.time.Clock()
+
+    profiler = pf.Profiler() if profile_path else pf.NULL_PROFILER
+    try:
+        play(scenes, buffers, worker, running, profiler)
+    finally:
+        profiler.endStep()
+        if profile_path:
+            profiler.save(profile_path)
+
+def play(scenes, buffers, worker, running, profiler):
+    curr_scene = -1
+    extra_frames = 0
+    frame = 0
+
+    while loop():
+        # Each frame's total runs from one buffer flip to the next, so it includes waiting for the frame rate
+        profiler.endStep()
+        profiler.beginStep(frame)
+        frame += 1
+
+        if running:
+            # Take at most one step per frame, so a simulation that outruns the viewer waits on its queue
+            ready, steps = worker.poll()
+            if ready:
+                if steps is None:
+                    running = False
+                    if worker.error is not None:
+                        raise worker.error
+
+                scenes.refresh()
+
+                pygame.display.set_caption("{} - step {}{}".format(simulationName, len(scenes),
+                                                                   " (running)" if running else ""))
+
+            if not scenes:
+                continue
+
+            curr_scene = len(scenes) - 1
+        else:
+            curr_scene = min(curr_scene + 1, len(scenes) - 1)
+
+        with profiler.stage("upload"):
+            scene = buffers.get(curr_scene, wrap = not running)
+        
+        with profiler.stage("render"):
+            render(scene, wireframe)
         
-        if extra_frames == max_extra_frames:
-            curr_scene = -1
-            extra_frames = 0
\ No newline at end of file
+        if curr_scene == len(scenes) -1 and not running:
+            extra_frames += 1
+            
+            if extra_frames == max_extra_frames:
+                curr_scene = -1
+                extra_frames = 0
+
+# Opens a frame store written by `python -m simulation`, or runs a simulation of the given number of steps if
+# given a number
+def load_scenes(source):
+    if os.path.isdir(source):
+        return frameStore.FrameStoreReader(source)
+
+    sim = simulation.Simulation()
+    sim.runSim(int(source))
+
+    return sim.scenes
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Views the results of a fracture simulation")
+    parser.add_argument("source", nargs="?", default="100",
+                        help="frame store directory to play back, or a number of steps to simulate (default: 100)")
+    parser.add_argument("--vram-budget", type=float, default=256.,
+                        help="megabytes of frame buffers to keep on the GPU (default: 256)")
+    parser.add_argument("--prefetch", type=int, default=4, help="number of frames to upload ahead of playback")
+    parser.add_argument("--live", action="store_true",
+                        help="when simulating, show each step as soon as it is done instead of after the whole run")
+    parser.add_argument("--output", help="directory to write the frame store of a live run to "
+                                         "(default: a temporary directory removed on exit)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write frame, upload and render times to PATH (.json or .csv) on exit")
+    args = parser.parse_args(argv)
+
+    vram_budget = int(args.vram_budget * 1024 * 1024)
+
+    if args.live and not os.path.isdir(args.source):
+        # Steps go through a frame store on disk, so the viewer holds no more than the frames on the GPU
+        with tempfile.TemporaryDirectory(prefix="fractureSim_") as directory:
+            path = args.output or directory
+            worker = simulationWorker.SimulationWorker(simulation.Simulation(keepScenes = False, frameStorePath = path),
+                                                       int(args.source))
+            # Emptied first, so the reader never maps frames of an earlier run that the simulation then truncates
+            frameStore.FrameStore(path).close()
+            try:
+                view(frameStore.FrameStoreReader(path), vram_budget, args.prefetch, worker, args.profile)
+            finally:
+                worker.stop()
+                worker.join()
+    else:
+        view(load_scenes(args.source), vram_budget, args.prefetch, profile_path = args.profile)
+
+#---------Execution----------  
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import os
+import numpy as np
+import sceneData as sd
+
+VERTEX_FILE = "vertices.bin"
+FACE_FILE = "faces.bin"
+INDEX_FILE = "index.bin"
+
+# Each frame's index entry: vertex offset, vertex count, face offset, face count
+INDEX_COLUMNS = 4
+
+# Types vertices and faces are stored as
+VERTEX_DTYPE = np.float32
+FACE_DTYPE = np.uint32
+
+# Returns data, or a copy of it with room for at least required rows, doubling its length until it fits, so that
+# filling an array a few rows at a time costs amortised constant time per row
+def grow(data, required):
+    capacity = max(len(data), 1024)
+    while capacity < required:
+        capacity *= 2
+
+    if capacity == len(data):
+        return data
+
+    grown = np.zeros((capacity,) + data.shape[1:], dtype=data.dtype)
+    grown[:len(data)] = data
+
+    return grown
+
+# Where each frame's vertices and faces are within all the data written so far, for anything that stores frames the
+# way a frame store does. index, if given, holds the entries of frames already written
+class FrameIndex:
+    def __init__(self, index = None):
+        self.numFrames = 0
+        self.numVertices = 0
+        self.numFaces = 0
+        self.lastFrame = None
+
+        if index is not None and len(index) > 0:
+            self.numFrames = len(index)
+            self.numVertices = int((index[:, 0] + index[:, 1]).max())
+            self.numFaces = int((index[:, 2] + index[:, 3]).max())
+            self.lastFrame = tuple(int(value) for value in index[-1])
+
+    def __len__(self):
+        return self.numFrames
+
+    # Adds a frame, returning its vertices and faces that have to be written and its index entry. If grows is set,
+    # the first vertices and faces must be the previous frame's unchanged, and only the rest are new. Otherwise the
+    # whole frame is new
+    def append(self, vertices, faces, grows = True):
+        vertices = np.asarray(vertices, dtype=VERTEX_DTYPE).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=FACE_DTYPE).reshape(-1, 3)
+
+        if grows and self.lastFrame is not None:
+            vertexOffset, vertexCount, faceOffset, faceCount = self.lastFrame
+        else:
+            vertexOffset, vertexCount, faceOffset, faceCount = self.numVertices, 0, self.numFaces, 0
+
+        self.numVertices += len(vertices) - vertexCount
+        self.numFaces += len(faces) - faceCount
+        self.lastFrame = (vertexOffset, len(vertices), faceOffset, len(faces))
+        self.numFrames += 1
+
+        return vertices[vertexCount:], faces[faceCount:], self.lastFrame
+
+# Writes the mesh of every simulation step to flat binary files in a directory, so it can be played back without
+# holding it in memory. The crack mesh only grows, so when a frame extends the previous one only its new vertices
+# and faces are written, and the frame points at the previous frame's data plus the appended part
+# With keepFrames, an existing store is reopened and cut back to its first keepFrames frames, so a resumed run can
+# carry on writing from there
+class FrameStore:
+    def __init__(self, path, keepFrames = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        index = None
+        if keepFrames:
+            index = np.fromfile(os.path.join(path, INDEX_FILE), dtype=np.int64).reshape(-1, INDEX_COLUMNS)
+            if len(index) < keepFrames:
+                raise ValueError("frame store {} has {} frames, can't keep {}".format(path, len(index), keepFrames))
+
+            index = index[:keepFrames]
+
+        self.frames = FrameIndex(index)
+        self.vertexFile = self.openFile(VERTEX_FILE, self.frames.numVertices * 3 * 4)
+        self.faceFile = self.openFile(FACE_FILE, self.frames.numFaces * 3 * 4)
+        self.indexFile = self.openFile(INDEX_FILE, self.frames.numFrames * INDEX_COLUMNS * 8)
+
+    # Opens a file for writing at the end of its first size bytes, dropping anything after them
+    def openFile(self, name, size):
+        filename = os.path.join(self.path, name)
+        if size == 0:
+            return open(filename, 'wb')
+
+        f = open(filename, 'r+b')
+        f.truncate(size)
+        f.seek(size)
+
+        return f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.frames)
+
+    # Adds a frame. If grows is set, the first vertices and faces must be the previous frame's unchanged, and
+    # only the rest are written. Otherwise the whole frame is written
+    def append(self, vertices, faces, grows = True):
+        newVertices, newFaces, entry = self.frames.append(vertices, faces, grows)
+
+        self.vertexFile.write(newVertices.tobytes())
+        self.faceFile.write(newFaces.tobytes())
+
+        # The index is written last, so a reader never sees a frame whose data is not there yet
+        self.vertexFile.flush()
+        self.faceFile.flush()
+        self.indexFile.write(np.array(entry, dtype=np.int64).tobytes())
+        self.indexFile.flush()
+
+    def close(self):
+        for f in (self.vertexFile, self.faceFile, self.indexFile):
+            f.close()
+
+# Frames stored the way a frame store stores them, read back as scenes. Subclasses set index to the frames' index
+# entries and provide frame(i), returning frame i's vertices and faces
+# Frames can be used like the list of scenes a simulation keeps in memory
+class FrameSequence:
+    def __init__(self):
+        self.index = np.zeros((0, INDEX_COLUMNS), dtype=np.int64)
+
+        # Offsets of the frame the normals were last found for, how many of its faces and vertices they cover, and
+        # the normal sums and normals themselves, in arrays that double in size when full, so a frame that extends it
+        # only has to add up its new faces
+        self.normalState = None
+        self.normalSums = np.zeros((0, 3))
+        self.normalData = np.zeros((0, 3), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("frame index out of range")
+
+        vertices, faces = self.frame(i)
+
+        return sd.createScene(vertices, faces, self.normals(i, vertices, faces))
+
+    # Vertex normals of frame i. When the frame extends the one they were last found for, only its new faces are
+    # added to the sums, and only the vertices they touch are normalised again, so stepping through a growing mesh
+    # doesn't go over its whole history for every frame
+    def normals(self, i, vertices, faces):
+        vertexOffset, vertexCount, faceOffset, faceCount = (int(value) for value in self.index[i])
+        state = self.normalState
+
+        if state is not None and state[:2] == (vertexOffset, faceOffset) and state[2] <= faceCount and \
+                state[3] <= vertexCount:
+            firstFace, firstVertex = state[2:]
+        else:
+            firstFace, firstVertex = 0, 0
+
+        self.normalSums = grow(self.normalSums, vertexCount)
+        self.normalData = grow(self.normalData, vertexCount)
+        self.normalSums[firstVertex:vertexCount] = 0.
+        self.normalData[firstVertex:vertexCount] = 0.
+
+        # Sums over the new faces, found for just the vertices they use
+        newFaces = faces[firstFace:]
+        if len(newFaces) > 0:
+            used, local = np.unique(newFaces, return_inverse=True)
+            sums = sd.normalSums(vertices[used], local.reshape(-1, 3), len(used))
+            self.normalSums[used] += sums
+            self.normalData[used] = sd.normalise(self.normalSums[used])
+
+        self.normalState = (vertexOffset, faceOffset, faceCount, vertexCount)
+
+        # Copied, as the sums go on changing for later frames
+        return np.copy(self.normalData[:vertexCount])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+# Memory maps a frame store. Frames are zero-copy views of the mapped files, so any frame can be read in constant
+# time and only the pages that are actually used get loaded
+# A store that is still being written can be read too, calling refresh to pick up new frames. Until its writer has
+# created the files, it has no frames
+class FrameStoreReader(FrameSequence):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.refresh()
+
+    def mapFile(self, name, dtype, columns):
+        filename = os.path.join(self.path, name)
+        rows = os.path.getsize(filename) // (np.dtype(dtype).itemsize * columns) if os.path.exists(filename) else 0
+
+        if rows == 0:
+            return np.zeros((0, columns), dtype=dtype)
+
+        return np.memmap(filename, dtype=dtype, mode='r', shape=(rows, columns))
+
+    # Maps the files again to pick up frames written since the store was opened
+    def refresh(self):
+        self.index = self.mapFile(INDEX_FILE, np.int64, INDEX_COLUMNS)
+        self.vertices = self.mapFile(VERTEX_FILE, VERTEX_DTYPE, 3)
+        self.faces = self.mapFile(FACE_FILE, FACE_DTYPE, 3)
+
+    def frame(self, i):
+        vertexOffset, vertexCount, faceOffset, faceCount = self.index[i]
+
+        return (self.vertices[vertexOffset:vertexOffset + vertexCount],
+                self.faces[faceOffset:faceOffset + faceCount])
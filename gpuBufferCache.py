@@ -0,0 +1,73 @@
+import collections
+
+# Keeps the GL buffers of recently shown frames, uploading frames when playback reaches them and releasing the
+# least recently used ones once the total size of the uploaded buffers goes over budgetBytes
+# upload(scene) and release(scene) do the GL work, so this only decides when to call them
+class GpuBufferCache:
+    def __init__(self, scenes, upload, release, budgetBytes = 256 * 1024 * 1024, prefetch = 4):
+        self.scenes = scenes
+        self.upload = upload
+        self.release = release
+        self.budgetBytes = budgetBytes
+        self.prefetch = prefetch
+
+        # Frame index -> (scene, bytes), least recently used first
+        self.resident = collections.OrderedDict()
+        self.residentBytes = 0
+
+    def __len__(self):
+        return len(self.scenes)
+
+    # Bytes of GPU memory a scene's buffers take up: interleaved float positions and normals, and uint indices
+    def sceneBytes(self, scene):
+        return sum(len(mesh.vertices) * 24 + len(mesh.faces) * 12 for mesh in scene.meshes)
+
+    def load(self, index):
+        if index in self.resident:
+            self.resident.move_to_end(index)
+            return self.resident[index][0]
+
+        scene = self.scenes[index]
+        self.upload(scene)
+
+        size = self.sceneBytes(scene)
+        self.resident[index] = (scene, size)
+        self.residentBytes += size
+
+        return scene
+
+    # Releases least recently used frames until the cache fits its budget, never releasing the frames in keep
+    def evict(self, keep):
+        for index in list(self.resident):
+            if self.residentBytes <= self.budgetBytes:
+                break
+            if index in keep:
+                continue
+
+            scene, size = self.resident.pop(index)
+            self.release(scene)
+            self.residentBytes -= size
+
+    # Returns frame index with its buffers uploaded, after making sure the next few frames are uploaded too
+    # Prefetching wraps around to the first frames, as playback loops, unless wrap is False, such as while frames are
+    # still being added and the last one is the one being shown
+    def get(self, index, wrap = True):
+        if wrap:
+            ahead = [(index + i) % len(self.scenes) for i in range(1, self.prefetch + 1)]
+        else:
+            ahead = list(range(index + 1, min(index + self.prefetch + 1, len(self.scenes))))
+        for i in reversed(ahead):
+            self.load(i)
+
+        # Loaded last, so the frame being shown is the most recently used
+        scene = self.load(index)
+        self.evict({index})
+
+        return scene
+
+    def clear(self):
+        for scene, size in self.resident.values():
+            self.release(scene)
+
+        self.resident.clear()
+        self.residentBytes = 0
@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pymesh
+
+import crackMesh as cm
+import intersection as ix
+
+# Bumped whenever what is cached changes, so entries written by older code are never read
+CACHE_VERSION = 1
+
+# Welds coincident vertices, drops collapsed faces and removes vertices no face uses. Quads are split in two
+def cleanGeometry(vertices, faces):
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    if faces.shape[1] == 4:
+        faces = np.concatenate((faces[:, [0, 1, 2]], faces[:, [0, 2, 3]]))
+
+    vertices, faces = cm.weldVertices(vertices, faces)
+    faces = cm.removeCollapsedFaces(faces)
+
+    used, faces = np.unique(faces, return_inverse=True)
+
+    return vertices[used], faces.reshape(-1, 3)
+
+# SHA-1 of a file's contents, read in blocks so large meshes are never held in memory twice
+def fileHash(path):
+    key = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            key.update(block)
+
+    return key.hexdigest()
+
+# A mesh the crack grows inside, loaded from an OBJ, STL, PLY or any other file PyMesh reads, together with the
+# intersector (and BVH) built over its triangles
+# Everything is derived from the file's contents, so it can be cached by content hash and memory mapped back in
+class HostMesh:
+    def __init__(self, vertices, faces, intersector):
+        self.vertices = vertices
+        self.faces = faces
+        self.intersector = intersector
+
+        self.lower = np.asarray(vertices).min(axis=0)
+        self.upper = np.asarray(vertices).max(axis=0)
+
+        # How long the mesh took to get ready, and whether that was from the cache
+        self.loadTime = 0.
+        self.fromCache = False
+
+        self.pyMesh = None
+
+    @classmethod
+    def fromFile(cls, path, useBvh = None):
+        start = time.perf_counter()
+
+        mesh = pymesh.load_mesh(path)
+        vertices, faces = cleanGeometry(mesh.vertices, mesh.faces)
+        host = cls(vertices, faces, ix.TriangleIntersector(vertices, faces, useBvh))
+
+        host.loadTime = time.perf_counter() - start
+
+        return host
+
+    # Loads the preprocessed mesh from cacheDir, parsing the file and storing the result there first if it is not
+    # already cached
+    @classmethod
+    def cached(cls, path, cacheDir, useBvh = None):
+        start = time.perf_counter()
+        key = "{}_v{}_{}".format(fileHash(path), CACHE_VERSION, {None: "auto", True: "bvh", False: "flat"}[useBvh])
+        entry = os.path.join(cacheDir, "host_{}".format(key))
+
+        if os.path.isdir(entry):
+            host = cls.load(entry)
+            host.fromCache = True
+        else:
+            host = cls.fromFile(path, useBvh)
+            host.save(entry)
+
+        host.loadTime = time.perf_counter() - start
+
+        return host
+
+    # Every array is stored as its own .npy file so that it can be memory mapped, which np.load can't do for .npz
+    @classmethod
+    def load(cls, directory, mmap = True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+
+        def array(name):
+            return np.load(os.path.join(directory, name + ".npy"), mmap_mode=mode)
+
+        intersector = ix.TriangleIntersector.fromArrays({name: array("intersector_" + name)
+                                                         for name in meta["intersectorArrays"]})
+
+        return cls(array("vertices"), array("faces"), intersector)
+
+    # Writes to a temporary directory that is renamed into place, so an interrupted save never leaves a broken cache
+    # entry behind. If another process saved the same entry first, its copy is kept
+    def save(self, directory):
+        tempDirectory = "{}.tmp{}".format(directory, os.getpid())
+        os.makedirs(tempDirectory, exist_ok=True)
+
+        arrays = self.intersector.toArrays()
+        np.save(os.path.join(tempDirectory, "vertices.npy"), np.asarray(self.vertices))
+        np.save(os.path.join(tempDirectory, "faces.npy"), np.asarray(self.faces))
+        for name, value in arrays.items():
+            np.save(os.path.join(tempDirectory, "intersector_{}.npy".format(name)), np.asarray(value))
+
+        with open(os.path.join(tempDirectory, "meta.json"), 'w') as f:
+            json.dump({"version": CACHE_VERSION, "numVertices": len(self.vertices), "numFaces": len(self.faces),
+                       "intersectorArrays": sorted(arrays)}, f, indent=2)
+
+        try:
+            os.replace(tempDirectory, directory)
+        except OSError:
+            shutil.rmtree(tempDirectory, ignore_errors=True)
+
+    # PyMesh's own mesh, only formed when something needs it, such as baking a distance field
+    @property
+    def mesh(self):
+        if self.pyMesh is None:
+            self.pyMesh = pymesh.form_mesh(np.asarray(self.vertices), np.asarray(self.faces))
+
+        return self.pyMesh
+
+    @property
+    def centre(self):
+        return (self.lower + self.upper) / 2.
+
+# Times loading a mesh file from scratch and again from the cache
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Preprocesses a host mesh into the cache and reports load times")
+    parser.add_argument("path", help="mesh file (OBJ, STL, PLY, ...)")
+    parser.add_argument("--cache-dir", default="cache", help="directory for cached preprocessed data")
+    args = parser.parse_args(argv)
+
+    cold = HostMesh.fromFile(args.path)
+    host = HostMesh.cached(args.path, args.cache_dir)
+    warm = HostMesh.cached(args.path, args.cache_dir)
+
+    print("{}: {} vertices, {} faces".format(args.path, len(host.vertices), len(host.faces)))
+    print("Cold load (parse and preprocess): {:.4f}s".format(cold.loadTime))
+    print("Warm load (memory mapped cache):  {:.4f}s ({:.1f}x faster)".format(
+        warm.loadTime, cold.loadTime / warm.loadTime if warm.loadTime > 0 else float('inf')))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+import pymesh
+
+# Keeps the host mesh minus everything subtracted from it so far, split into a regular grid of tiles
+# The crack only ever grows, and host - (A + B) = (host - A) - B, so each step only has to subtract the newly appended
+# strip, and only the quads of it that reach a tile from that tile. Every other tile is reused as it was, which keeps
+# the cost of a step proportional to the size of the strip rather than the whole crack
+# Each tile starts as the host clipped to the tile, so the walls between tiles stay in the result as hidden internal
+# faces wherever the crack hasn't cut through them
+class IncrementalDifference:
+    def __init__(self, host, tilesPerAxis = 4, engine = "cork"):
+        self.engine = engine
+        vertices = np.asarray(host.vertices, dtype=float)
+
+        # Padded so the host's outer faces lie strictly inside the outer tiles instead of on their walls
+        lower = vertices.min(axis=0)
+        upper = vertices.max(axis=0)
+        padding = 1e-3 * np.maximum(upper - lower, 1e-9)
+        self.edges = [np.linspace(lower[i] - padding[i], upper[i] + padding[i], tilesPerAxis + 1) for i in range(3)]
+
+        # Tile index -> PyMesh mesh of what is left of the host in that tile. Tiles the host misses are left out
+        self.tiles = {}
+        for key in np.ndindex(tilesPerAxis, tilesPerAxis, tilesPerAxis):
+            tileMin, tileMax = self.tileBounds(key)
+            tileBox = pymesh.generate_box_mesh(tileMin, tileMax)
+            piece = pymesh.boolean(host, tileBox, operation="intersection", engine=engine)
+
+            if len(piece.faces) > 0:
+                self.tiles[key] = piece
+
+        self.arrays = {}
+
+    def tileBounds(self, key):
+        tileMin = np.array([self.edges[axis][key[axis]] for axis in range(3)])
+        tileMax = np.array([self.edges[axis][key[axis] + 1] for axis in range(3)])
+
+        return tileMin, tileMax
+
+    # Every (box, tile) pair where box i, spanning [lower[i], upper[i]], overlaps the tile, as an array of box
+    # indices and an (n, 3) array of tile indices. The tiles each box overlaps are found per axis with a binary search
+    def tilesOverlapping(self, lower, upper):
+        numTiles = np.array([len(edges) - 1 for edges in self.edges])
+        first = np.stack([np.searchsorted(self.edges[axis], lower[:, axis], side='right') - 1 for axis in range(3)],
+                         axis=1)
+        last = np.stack([np.searchsorted(self.edges[axis], upper[:, axis], side='left') for axis in range(3)], axis=1)
+        first = np.clip(first, 0, numTiles)
+        last = np.clip(last, first, numTiles)
+
+        # Enumerates each box's block of tiles, with the last axis varying fastest
+        spans = last - first
+        counts = spans.prod(axis=1)
+        boxes = np.repeat(np.arange(len(lower)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        spans = spans[boxes]
+        offsets = np.stack((local // (spans[:, 1] * spans[:, 2]), (local // spans[:, 2]) % spans[:, 1],
+                            local % spans[:, 2]), axis=1)
+
+        return boxes, first[boxes] + offsets
+
+    # Subtracts the mesh made of faces (indexing into vertices) from every tile it overlaps, and returns the indices
+    # of the tiles that were cut. Faces with the same value in pieces must make up a closed part on their own, such
+    # as one quad of a crack strip. Each tile is only cut with the pieces whose bounding boxes reach it, so a step
+    # re-cuts the tiles around the strip's quads rather than every tile within the box around the whole strip.
+    # Without pieces, the faces are treated as a single part
+    def subtract(self, vertices, faces, pieces = None):
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if len(faces) == 0:
+            return []
+
+        vertices = np.asarray(vertices, dtype=float)
+        labels = np.zeros(len(faces), dtype=np.int64) if pieces is None else \
+            np.unique(np.asarray(pieces), return_inverse=True)[1].ravel()
+        numPieces = labels.max() + 1
+
+        corners = vertices[faces]
+        lower = np.full((numPieces, 3), np.inf)
+        upper = np.full((numPieces, 3), -np.inf)
+        np.minimum.at(lower, labels, corners.min(axis=1))
+        np.maximum.at(upper, labels, corners.max(axis=1))
+
+        boxes, keys = self.tilesOverlapping(lower, upper)
+        touched = []
+
+        for key in sorted(set(map(tuple, keys.tolist()))):
+            if key not in self.tiles:
+                continue
+
+            reaching = np.zeros(numPieces, dtype=bool)
+            reaching[boxes[np.all(keys == key, axis=1)]] = True
+            used, inverse = np.unique(faces[reaching[labels]], return_inverse=True)
+            cutter = pymesh.form_mesh(vertices[used], inverse.reshape(-1, 3))
+
+            piece = pymesh.boolean(self.tiles[key], cutter, operation="difference", engine=self.engine)
+            self.arrays.pop(key, None)
+            touched.append(key)
+
+            if len(piece.faces) > 0:
+                self.tiles[key] = piece
+            else:
+                del self.tiles[key]
+
+        return touched
+
+    # Every tile's remaining geometry joined into one vertex and face array. The arrays of tiles that weren't cut
+    # since the last call are reused
+    def mesh(self):
+        vertexArrays = []
+        faceArrays = []
+        numVertices = 0
+
+        for key in sorted(self.tiles):
+            if key not in self.arrays:
+                piece = self.tiles[key]
+                self.arrays[key] = (np.asarray(piece.vertices, dtype=float), np.asarray(piece.faces, dtype=np.int64))
+
+            tileVertices, tileFaces = self.arrays[key]
+            vertexArrays.append(tileVertices)
+            faceArrays.append(tileFaces + numVertices)
+            numVertices += len(tileVertices)
+
+        if not vertexArrays:
+            return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+        return np.concatenate(vertexArrays), np.concatenate(faceArrays)
@@ -0,0 +1,177 @@
+import numpy as np
+import bvh
+
+SMALL_NUM = 0.000001 # Tolerance for floats
+BVH_MIN_FACES = 64 # Below this many faces testing every triangle is cheaper than walking a tree
+
+# Dot product of the last axis, written out so it sums in the same order as np.dot does for a single pair of vectors
+def dot(a, b):
+    return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1] + a[..., 2] * b[..., 2]
+
+# Segment-triangle intersection for a whole crack front at once
+# Based on the algorithm found at http://geomalgorithms.com/a06-_intersect-2.html#intersect3D_RayTriangle()
+# Everything that only depends on the triangles is computed once when the intersector is created
+class TriangleIntersector:
+    def __init__(self, vertices, faces, useBvh = None):
+        vertices = np.asarray(vertices, dtype=float)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+        self.numFaces = len(faces)
+
+        self.v0 = vertices[faces[:, 0]]
+        self.u = vertices[faces[:, 1]] - self.v0
+        self.v = vertices[faces[:, 2]] - self.v0
+        self.n = np.cross(self.u, self.v)
+
+        self.uu = dot(self.u, self.u)
+        self.uv = dot(self.u, self.v)
+        self.vv = dot(self.v, self.v)
+        self.D = self.uv * self.uv - self.uu * self.vv
+
+        # Degenerate triangles are never hit
+        self.valid = np.count_nonzero(self.n, axis=1) > 0
+
+        # Upper bound on the number of segment/triangle pairs tested in one pass
+        self.chunkSize = 1 << 20
+
+        # Large meshes only test the triangles whose bounding boxes overlap each segment
+        if useBvh is None:
+            useBvh = self.numFaces >= BVH_MIN_FACES
+
+        self.bvh = bvh.BoundingVolumeHierarchy(vertices, faces) if useBvh else None
+
+        # Number of segment/triangle pairs the last call to intersect tested
+        self.lastPairsTested = 0
+
+    @classmethod
+    def fromMesh(cls, mesh, useBvh = None):
+        return cls(mesh.vertices, mesh.faces, useBvh)
+
+    # Per-triangle arrays, which together with the BVH's are all an intersector needs, so they can be cached
+    arrayNames = ("v0", "u", "v", "n", "uu", "uv", "vv", "D", "valid")
+
+    def toArrays(self):
+        arrays = {name: getattr(self, name) for name in self.arrayNames}
+        if self.bvh is not None:
+            arrays.update(("bvh_" + name, value) for name, value in self.bvh.toArrays().items())
+
+        return arrays
+
+    # Recreates an intersector from toArrays' output without recomputing anything, so the arrays can be memory mapped
+    @classmethod
+    def fromArrays(cls, arrays):
+        intersector = cls.__new__(cls)
+        for name in cls.arrayNames:
+            setattr(intersector, name, arrays[name])
+
+        intersector.numFaces = len(intersector.v0)
+        intersector.chunkSize = 1 << 20
+        intersector.lastPairsTested = 0
+
+        bvhArrays = {name[len("bvh_"):]: value for name, value in arrays.items() if name.startswith("bvh_")}
+        intersector.bvh = bvh.BoundingVolumeHierarchy.fromArrays(bvhArrays) if bvhArrays else None
+
+        return intersector
+
+    # Tests every segment p0[i] -> p1[i] against every triangle. Returns a hit mask and, for the segments that hit,
+    # the intersection point with the first triangle (in face order) that they hit
+    def intersect(self, p0, p1):
+        p0 = np.asarray(p0, dtype=float).reshape(-1, 3)
+        p1 = np.asarray(p1, dtype=float).reshape(-1, 3)
+
+        hits = np.zeros(len(p0), dtype=bool)
+        points = np.zeros((len(p0), 3))
+        self.lastPairsTested = len(p0) * self.numFaces
+
+        if self.numFaces == 0:
+            return hits, points
+
+        if self.bvh is not None:
+            return self.intersectCandidates(p0, p1, hits, points)
+
+        rowsPerChunk = max(1, self.chunkSize // self.numFaces)
+        faceIndices = np.arange(self.numFaces)
+
+        for start in range(0, len(p0), rowsPerChunk):
+            end = min(start + rowsPerChunk, len(p0))
+            segments = np.repeat(np.arange(start, end), self.numFaces)
+            triangles = np.tile(faceIndices, end - start)
+
+            pairHits, pairPoints = self.intersectPairs(p0, p1, segments, triangles)
+            pairHits = pairHits.reshape(end - start, self.numFaces)
+
+            chunkHits = pairHits.any(axis=1)
+            first = np.argmax(pairHits, axis=1)
+            pairPoints = pairPoints.reshape(end - start, self.numFaces, 3)
+
+            hits[start:end] = chunkHits
+            points[start:end][chunkHits] = pairPoints[chunkHits, first[chunkHits]]
+
+        return hits, points
+
+    # Only tests the segment/triangle pairs found by the BVH, keeping the lowest face index hit by each segment so the
+    # result matches the brute force test
+    def intersectCandidates(self, p0, p1, hits, points):
+        segments, triangles = self.bvh.querySegments(p0, p1)
+        self.lastPairsTested = len(segments)
+        firstFaces = np.full(len(p0), self.numFaces)
+
+        for start in range(0, len(segments), self.chunkSize):
+            pairHits, pairPoints = self.intersectPairs(p0, p1, segments[start:start + self.chunkSize],
+                                                       triangles[start:start + self.chunkSize])
+            hitSegments = segments[start:start + self.chunkSize][pairHits]
+            hitTriangles = triangles[start:start + self.chunkSize][pairHits]
+
+            chunkFirstFaces = np.full(len(p0), self.numFaces)
+            np.minimum.at(chunkFirstFaces, hitSegments, hitTriangles)
+
+            # Each segment/face pair only appears once, so this keeps exactly one pair per segment
+            first = (hitTriangles == chunkFirstFaces[hitSegments]) & (hitTriangles < firstFaces[hitSegments])
+            firstFaces[hitSegments[first]] = hitTriangles[first]
+            points[hitSegments[first]] = pairPoints[pairHits][first]
+
+        hits[:] = firstFaces < self.numFaces
+
+        return hits, points
+
+    # Tests segment segments[k] against triangle triangles[k] for every k
+    def intersectPairs(self, p0, p1, segments, triangles):
+        p0 = p0[segments]
+        direction = p1[segments] - p0
+
+        v0 = self.v0[triangles]
+        u = self.u[triangles]
+        v = self.v[triangles]
+        n = self.n[triangles]
+        uu = self.uu[triangles]
+        uv = self.uv[triangles]
+        vv = self.vv[triangles]
+        D = self.D[triangles]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w0 = p0 - v0
+            a = -dot(n, w0)
+            b = dot(n, direction)
+
+            # Ray is parallel to triangle plane or lies in the plane
+            hits = self.valid[triangles] & (np.abs(b) >= SMALL_NUM)
+
+            # Get intersect point of ray with triangle plane, which must lie between p0 and p1
+            r = a / b
+            hits &= (r >= 0.0) & (r <= 1.0)
+
+            isectPoint = p0 + (r[:, np.newaxis] * direction)
+
+            # Is isectPoint inside the triangle?
+            w = isectPoint - v0
+            wu = dot(w, u)
+            wv = dot(w, v)
+
+            # get and test parametric coords
+            s = (uv * wv - vv * wu) / D
+            hits &= (s >= 0.0) & (s <= 1.0)
+
+            t = (uv * wu - uu * wv) / D
+            hits &= (t >= 0.0) & ((s + t) <= 1.0)
+
+        return hits, isectPoint
@@ -1,57 +1,91 @@
 import numpy as np
-import random
-import math
+import crackFront as cf
 
+# A single marker is a view onto one row of a CrackFront, so reading or writing its attributes reads or writes the
+# front's arrays directly
 class Marker:
     def __init__(self, startLocation, direction):
-        self.currLocation = np.array(startLocation)
-        self.prevLocation = np.array(startLocation)
-        self.direction = np.array(direction)
-        self.moveSpeed = .095
-        self.finished = False
-        self.normal = np.array([0.,1.,0.])
-        
+        self.front = cf.CrackFront([startLocation], [direction])
+        self.index = 0
+
+    @classmethod
+    def fromFront(cls, front, index):
+        marker = cls.__new__(cls)
+        marker.front = front
+        marker.index = index
+
+        return marker
+
+    @property
+    def currLocation(self):
+        return self.front.currLocations[self.index]
+
+    @currLocation.setter
+    def currLocation(self, value):
+        self.front.currLocations[self.index] = value
+
+    @property
+    def prevLocation(self):
+        return self.front.prevLocations[self.index]
+
+    @prevLocation.setter
+    def prevLocation(self, value):
+        self.front.prevLocations[self.index] = value
+
+    @property
+    def direction(self):
+        return self.front.directions[self.index]
+
+    @direction.setter
+    def direction(self, value):
+        self.front.directions[self.index] = value
+
+    @property
+    def normal(self):
+        return self.front.normals[self.index]
+
+    @normal.setter
+    def normal(self, value):
+        self.front.normals[self.index] = value
+
+    @property
+    def moveSpeed(self):
+        return self.front.moveSpeeds[self.index]
+
+    @moveSpeed.setter
+    def moveSpeed(self, value):
+        self.front.moveSpeeds[self.index] = value
+
+    @property
+    def finished(self):
+        return bool(self.front.finished[self.index])
+
+    @finished.setter
+    def finished(self, value):
+        self.front.finished[self.index] = value
+
     def propagate(self, lowToughnessAreas, initCrack):
-        rng = 0 if initCrack else random.uniform(.15, 1.)
-        
-        rng *= self.calcMovementWeight(lowToughnessAreas)
-        
-        self.prevLocation = np.copy(self.currLocation)
-        
-        # Ensure energy conservation
-        forwardSpeed = self.moveSpeed * self.direction * (1. - abs(rng))
-        normalSpeed = rng * self.moveSpeed * self.normal
-        
-        self.currLocation += forwardSpeed + normalSpeed
-        
+        self.front.propagate(lowToughnessAreas, initCrack, np.array([self.index]))
+
     def calcMovementWeight(self, lowToughnessAreas):
-        deltaY = 1000.
-        lowestToughnessArea = 0.
-        maxWeight = .67
-        maxThreshold = 3.1
-        
-        for y in lowToughnessAreas:
-            if abs(self.currLocation[1] - y) < deltaY:
-                lowestToughnessArea = y
-                deltaY = abs(self.currLocation[1] - y)
-            
-        # Ideally we should set the max threshold to be the point of highest toughness between the marker and either
-        # the edge of the surface mesh, or the next low toughness area
-        maxThreshold = lowestToughnessArea
-        
-        constant = maxThreshold / (maxThreshold + .35)
-        
-        # Determined this equation through trial and error
-        scalarVal = pow(math.exp(.357 * pow(((constant * deltaY) - maxThreshold), 3.)), math.pi / 10.) + .004
-        
-        # Clamp value
-        scalarVal = min(scalarVal, 1.)
-        scalarVal = max(scalarVal, 0.)
-        
-        weight = maxWeight * scalarVal
-        
-        if lowestToughnessArea < self.currLocation[1]:
-            weight = -weight
-                
-        return weight
-                    
\ No newline at end of file
+        return self.front.calcMovementWeights(lowToughnessAreas, np.array([self.index]))[0]
+
+# Sequence of Marker views over a front, created on access so it always matches the front's current size
+class MarkerList:
+    def __init__(self, front):
+        self.front = front
+
+    def __len__(self):
+        return len(self.front)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.front)
+        if index < 0 or index >= len(self.front):
+            raise IndexError("marker index out of range")
+
+        return Marker.fromFront(self.front, index)
+
+    def __iter__(self):
+        for i in range(len(self.front)):
+            yield Marker.fromFront(self.front, i)
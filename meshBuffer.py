@@ -0,0 +1,83 @@
+import numpy as np
+import pymesh
+
+# Append-only triangle mesh stored in preallocated arrays that double in size when full, so appending is amortised
+# constant time per element. The vertices and faces properties are views of the filled part of the arrays
+# Each face also carries a tag, so several meshes (such as one per crack) can share a buffer and still be told apart,
+# and the index of the piece it belongs to, where each piece is a closed part of the mesh on its own
+class MeshBuffer:
+    def __init__(self, vertexCapacity = 1024, faceCapacity = 2048):
+        self.vertexData = np.zeros((vertexCapacity, 3))
+        self.faceData = np.zeros((faceCapacity, 3), dtype=np.int64)
+        self.tagData = np.zeros(faceCapacity, dtype=np.int32)
+        self.pieceData = np.zeros(faceCapacity, dtype=np.int64)
+        self.numVertices = 0
+        self.numFaces = 0
+        self.numPieces = 0
+
+    @property
+    def vertices(self):
+        return self.vertexData[:self.numVertices]
+
+    @property
+    def faces(self):
+        return self.faceData[:self.numFaces]
+
+    @property
+    def tags(self):
+        return self.tagData[:self.numFaces]
+
+    @property
+    def pieces(self):
+        return self.pieceData[:self.numFaces]
+
+    # Faces with the given tag, indexing into the whole buffer's vertices
+    def taggedFaces(self, tag):
+        return self.faces[self.tags == tag]
+
+    def grow(self, data, required):
+        capacity = max(len(data), 1)
+        while capacity < required:
+            capacity *= 2
+
+        if capacity == len(data):
+            return data
+
+        grown = np.zeros((capacity,) + data.shape[1:], dtype=data.dtype)
+        grown[:len(data)] = data
+
+        return grown
+
+    # Appends the vertices and returns their indices in the buffer
+    def appendVertices(self, vertices):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        start = self.numVertices
+
+        self.vertexData = self.grow(self.vertexData, start + len(vertices))
+        self.vertexData[start:start + len(vertices)] = vertices
+        self.numVertices += len(vertices)
+
+        return np.arange(start, self.numVertices)
+
+    # pieces numbers the pieces within the appended faces from 0 and are renumbered to follow the buffer's existing
+    # ones. Without it, the faces are appended as a single piece
+    def appendFaces(self, faces, tag = 0, pieces = None):
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        start = self.numFaces
+        if len(faces) == 0:
+            return
+
+        pieces = np.zeros(len(faces), dtype=np.int64) if pieces is None else np.asarray(pieces, dtype=np.int64)
+
+        self.faceData = self.grow(self.faceData, start + len(faces))
+        self.tagData = self.grow(self.tagData, start + len(faces))
+        self.pieceData = self.grow(self.pieceData, start + len(faces))
+        self.faceData[start:start + len(faces)] = faces
+        self.tagData[start:start + len(faces)] = tag
+        self.pieceData[start:start + len(faces)] = self.numPieces + pieces
+        self.numFaces += len(faces)
+        self.numPieces += int(pieces.max()) + 1
+
+    # Builds a PyMesh mesh of the current contents, which is only needed when something asks for one
+    def toPyMesh(self):
+        return pymesh.form_mesh(np.copy(self.vertices), np.copy(self.faces))
@@ -0,0 +1,173 @@
+import argparse
+import ctypes
+import os
+import struct
+import time
+import zlib
+import numpy as np
+
+# Renders simulation frames to PNG files without a window, drawing into a framebuffer object on a software GL
+# context. PyOpenGL picks its platform when it is first imported, so nothing here imports it (or fractureSim)
+# until the platform has been chosen
+
+# Writes an 8-bit RGB image, given as a (height, width, 3) array with the top row first
+def writePng(path, rgb):
+    height, width = rgb.shape[:2]
+    rows = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, -1)), axis=1)
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+def createEglContext():
+    from OpenGL import EGL
+
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    if not EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+        raise RuntimeError("could not initialise EGL")
+
+    config = EGL.EGLConfig()
+    numConfigs = EGL.EGLint()
+    attributes = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                  EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+    if not EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(numConfigs)) \
+            or numConfigs.value == 0:
+        raise RuntimeError("no EGL config supports desktop OpenGL")
+
+    # The shaders use the fixed function matrices, so this needs a compatibility context, which is the default
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+
+    # No surface at all: everything is drawn into the framebuffer object
+    if not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context):
+        raise RuntimeError("could not make the EGL context current")
+
+    return (display, context)
+
+def createOsmesaContext(width, height):
+    from OpenGL import osmesa
+    from OpenGL import arrays
+    import OpenGL.GL as gl
+
+    context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+    if not context:
+        raise RuntimeError("could not create an OSMesa context")
+
+    # OSMesa needs a buffer to make its context current, even though drawing goes to the framebuffer object
+    buffer = arrays.GLubyteArray.zeros((height, width, 4))
+    if not osmesa.OSMesaMakeCurrent(context, buffer, gl.GL_UNSIGNED_BYTE, width, height):
+        raise RuntimeError("could not make the OSMesa context current")
+
+    return (context, buffer)
+
+def createFramebuffer(width, height):
+    import OpenGL.GL as gl
+
+    framebuffer = gl.glGenFramebuffers(1)
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+
+    color, depth = gl.glGenRenderbuffers(2)
+    gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, color)
+    gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+    gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, color)
+
+    gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, depth)
+    gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_DEPTH_COMPONENT24, width, height)
+    gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_DEPTH_ATTACHMENT, gl.GL_RENDERBUFFER, depth)
+
+    if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("offscreen framebuffer is incomplete")
+
+    gl.glViewport(0, 0, width, height)
+
+    return framebuffer
+
+# Selects the platform and creates a current context with a framebuffer object of the given size to draw into
+def initOffscreen(platform, width, height):
+    os.environ["PYOPENGL_PLATFORM"] = platform
+    if platform == "egl":
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+    context = createEglContext() if platform == "egl" else createOsmesaContext(width, height)
+    framebuffer = createFramebuffer(width, height)
+
+    return context, framebuffer
+
+def readPixels(width, height):
+    import OpenGL.GL as gl
+
+    gl.glFinish()
+    pixels = gl.glReadPixels(0, 0, width, height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+    image = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 4)
+
+    # OpenGL's first row is the bottom one. Alpha is dropped, as the window shows the image opaque
+    return np.ascontiguousarray(np.flipud(image)[:, :, :3])
+
+# Draws each selected frame with the viewer's shader and camera and writes it to outDir as frame_00000.png etc.
+# Frames are drawn back to back with no frame rate limit
+def renderFrames(scenes, outDir, width, height, frames = None, wireframe = False):
+    import OpenGL.GL as gl
+    import fractureSim
+    import defaultCamera
+
+    fractureSim.prepare_shaders()
+    fractureSim.set_camera(defaultCamera.DefaultCamera(width, height, 45.))
+
+    os.makedirs(outDir, exist_ok=True)
+    frames = range(len(scenes)) if frames is None else frames
+    paths = []
+
+    for i in frames:
+        scene = scenes[i]
+        for mesh in scene.meshes:
+            fractureSim.prepare_gl_buffers(mesh)
+
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        fractureSim.render(scene, wireframe)
+
+        path = os.path.join(outDir, "frame_{:05d}.png".format(i))
+        writePng(path, readPixels(width, height))
+        paths.append(path)
+
+        # Frames are only drawn once, so their buffers can go straight away
+        fractureSim.release_scene(scene)
+
+    return paths
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Renders simulation frames to PNG files without a display")
+    parser.add_argument("source", help="frame store directory, or a number of steps to simulate")
+    parser.add_argument("output", help="directory the PNG files are written to")
+    parser.add_argument("--width", type=int, default=1024, help="image width in pixels")
+    parser.add_argument("--height", type=int, default=768, help="image height in pixels")
+    parser.add_argument("--platform", choices=["egl", "osmesa"], default="egl",
+                        help="software GL platform to render with")
+    parser.add_argument("--first", type=int, default=0, help="first frame to render")
+    parser.add_argument("--last", type=int, help="last frame to render (default: the final frame)")
+    parser.add_argument("--every", type=int, default=1, help="only render every nth frame")
+    parser.add_argument("--wireframe", action="store_true", help="render in wireframe")
+    args = parser.parse_args(argv)
+
+    initOffscreen(args.platform, args.width, args.height)
+
+    import fractureSim
+    scenes = fractureSim.load_scenes(args.source)
+
+    last = len(scenes) - 1 if args.last is None else min(args.last, len(scenes) - 1)
+    start = time.perf_counter()
+    paths = renderFrames(scenes, args.output, args.width, args.height,
+                         range(args.first, last + 1, args.every), args.wireframe)
+    elapsed = time.perf_counter() - start
+
+    print("Rendered {} frames in {:.2f}s ({:.1f} frames/s)".format(len(paths), elapsed,
+                                                                    len(paths) / elapsed if elapsed > 0 else 0.))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Wall-clock time per stage, counters and peak memory for each step of a run
+# Stages and counters are keyed by name, so new ones can be added anywhere without changing this class
+class Profiler:
+    def __init__(self, traceMemory = False):
+        # tracemalloc gives a peak per step but slows everything down, so by default the process' peak resident
+        # size is recorded instead
+        self.traceMemory = traceMemory
+        self.steps = []
+        self.current = None
+        self.stepStart = None
+
+        # Only tracing started here is stopped again by close, so a caller already tracing is left as it was
+        self.startedTracing = traceMemory and not tracemalloc.is_tracing()
+        if self.startedTracing:
+            tracemalloc.start()
+
+    @property
+    def enabled(self):
+        return True
+
+    def beginStep(self, index):
+        self.current = {"step": index, "times": {}, "counters": {}}
+        self.stepStart = time.perf_counter()
+
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+
+    def endStep(self):
+        if self.current is None:
+            return
+
+        self.current["total"] = time.perf_counter() - self.stepStart
+        self.current["peakMemory"] = self.peakMemory()
+        self.steps.append(self.current)
+        self.current = None
+
+    def peakMemory(self):
+        if self.traceMemory:
+            return tracemalloc.get_traced_memory()[1]
+        if resource is not None:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.current is not None:
+                times = self.current["times"]
+                times[name] = times.get(name, 0.) + time.perf_counter() - start
+
+    def count(self, name, value = 1):
+        if self.current is not None:
+            counters = self.current["counters"]
+            counters[name] = counters.get(name, 0) + value
+
+    # Stops tracemalloc if this started it. Steps recorded so far keep their peaks, but no more should be recorded
+    def close(self):
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    # Sum of every stage time and counter over all steps
+    def totals(self):
+        totals = {"steps": len(self.steps), "total": sum(step["total"] for step in self.steps), "times": {},
+                  "counters": {}, "peakMemory": max((step["peakMemory"] for step in self.steps), default=0)}
+
+        for step in self.steps:
+            for key in ("times", "counters"):
+                for name, value in step[key].items():
+                    totals[key][name] = totals[key].get(name, 0) + value
+
+        return totals
+
+    def toJson(self, path):
+        with open(path, 'w') as f:
+            json.dump({"steps": self.steps, "totals": self.totals()}, f, indent=2)
+
+    # One row per step, with a column for every stage and counter that appeared in any step
+    def toCsv(self, path):
+        stages = sorted({name for step in self.steps for name in step["times"]})
+        counters = sorted({name for step in self.steps for name in step["counters"]})
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["step", "total"] + ["time_" + name for name in stages] + counters + ["peakMemory"])
+
+            for step in self.steps:
+                writer.writerow([step["step"], step["total"]] + [step["times"].get(name, 0.) for name in stages] +
+                                [step["counters"].get(name, 0) for name in counters] + [step["peakMemory"]])
+
+    # Writes JSON or CSV depending on the file extension
+    def save(self, path):
+        if path.lower().endswith(".csv"):
+            self.toCsv(path)
+        else:
+            self.toJson(path)
+
+# Stands in for a Profiler when profiling is off. Every method does nothing, and stage() hands back one shared
+# context manager, so instrumented code costs a couple of attribute lookups
+class NullProfiler:
+    nullStage = contextlib.nullcontext()
+    steps = ()
+
+    @property
+    def enabled(self):
+        return False
+
+    def beginStep(self, index):
+        pass
+
+    def endStep(self):
+        pass
+
+    def stage(self, name):
+        return self.nullStage
+
+    def count(self, name, value = 1):
+        pass
+
+    def close(self):
+        pass
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,20 @@
+import numpy as np
+
+# Source of every random number a simulation uses. Each crack (or any other consumer) gets its own Generator,
+# derived from the simulation's seed and a fixed key, so its numbers don't depend on how many other streams exist,
+# the order they are used in or which process uses them
+class RandomStreams:
+    def __init__(self, seed = None):
+        # Without a seed fresh entropy is drawn, and kept so the run can still be repeated
+        self.seedSequence = np.random.SeedSequence(seed)
+        self.entropy = self.seedSequence.entropy
+
+    def seedSequenceFor(self, *key):
+        return np.random.SeedSequence(self.entropy, spawn_key=key)
+
+    def generator(self, *key):
+        return np.random.default_rng(self.seedSequenceFor(*key))
+
+    # Stream for the crack with the given index
+    def crackGenerator(self, crackIndex):
+        return self.generator(0, crackIndex)
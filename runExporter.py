@@ -0,0 +1,126 @@
+import os
+import zipfile
+import numpy as np
+import frameStore as fs
+
+# Each step's chunk entry: number of vertices and faces it added to the data of all the chunks before it
+CHUNK_COLUMNS = 2
+
+# Vertices and faces are stored as the frame store stores them
+DTYPES = {"vertices": fs.VERTEX_DTYPE, "faces": fs.FACE_DTYPE}
+
+# Name of a chunk as np.load lists it. The member in the file has .npy on the end
+def chunkName(kind, i):
+    return "{}_{:06d}".format(kind, i)
+
+# Streams the mesh of every step of a run into a single .npz file, which np.load (or any zip reader) can open
+# Like a frame store, a frame that extends the previous one only adds its new vertices and faces, each step
+# becoming one vertices_NNNNNN and faces_NNNNNN member. Members are written as steps complete and nothing but the
+# index is held in memory, which is written along with the chunk sizes once the run is closed, in the frame store's
+# layout with offsets into the chunks laid end to end
+# The file is written under a temporary name and only moved into place once it is closed, as a zip can't be read
+# before its central directory is written
+class RunExporter:
+    def __init__(self, path, compress = False, firstStep = 0):
+        self.path = path
+        self.tempPath = path + ".tmp"
+        self.file = zipfile.ZipFile(self.tempPath, 'w', zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                    allowZip64=True)
+
+        self.firstStep = firstStep
+        self.frames = fs.FrameIndex()
+        self.index = []
+        self.chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def writeArray(self, name, array):
+        with self.file.open(name + ".npy", 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asarray(array), allow_pickle=False)
+
+    # Adds a frame. If grows is set, the first vertices and faces must be the previous frame's unchanged, and
+    # only the rest are written. Otherwise the whole frame is written
+    def append(self, vertices, faces, grows = True):
+        newVertices, newFaces, entry = self.frames.append(vertices, faces, grows)
+
+        chunk = len(self.index)
+        self.writeArray(chunkName("vertices", chunk), newVertices)
+        self.writeArray(chunkName("faces", chunk), newFaces)
+        self.chunks.append((len(newVertices), len(newFaces)))
+        self.index.append(entry)
+
+    def close(self):
+        if self.file is None:
+            return
+
+        self.writeArray("index", np.array(self.index, dtype=np.int64).reshape(-1, fs.INDEX_COLUMNS))
+        self.writeArray("chunks", np.array(self.chunks, dtype=np.int64).reshape(-1, CHUNK_COLUMNS))
+        self.writeArray("firstStep", np.array(self.firstStep, dtype=np.int64))
+        self.file.close()
+        self.file = None
+
+        os.replace(self.tempPath, self.path)
+
+# Reads frames back from a run export. Only the chunks a frame spans are read and decompressed. They are put together
+# in a buffer that doubles in size when full, so when the next frame extends the last one, only the chunks it adds
+# are read and copied into the buffer after it, and playing a run in order reads and copies each chunk about once
+class RunExportReader(fs.FrameSequence):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.data = np.load(path)
+        self.index = self.data["index"]
+        self.firstStep = int(self.data["firstStep"])
+
+        # Where each chunk's rows start within all the chunks laid end to end
+        chunks = self.data["chunks"]
+        self.vertexStarts = np.concatenate(([0], np.cumsum(chunks[:, 0])))
+        self.faceStarts = np.concatenate(([0], np.cumsum(chunks[:, 1])))
+
+        # Kind -> offset of the last rows put together, how many there are, the index of the chunk after them and the
+        # buffer holding them
+        self.assembled = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Rows [offset, offset + count) of the chunks of one kind laid end to end, as a view of the buffer
+    def rows(self, kind, starts, offset, count):
+        first = np.searchsorted(starts, offset, side='right') - 1
+        last = np.searchsorted(starts, offset + count, side='left')
+
+        state = self.assembled.get(kind)
+        if state is not None and state[0] == offset and state[1] <= count and offset + state[1] == starts[state[2]]:
+            numRows, nextChunk, buffer = state[1:]
+        else:
+            # Started again in a new buffer rather than over the old one, so rows handed out before stay as they were
+            numRows, nextChunk, buffer = 0, first, np.zeros((0, 3), dtype=DTYPES[kind])
+
+        for i in range(nextChunk, last):
+            chunk = self.data[chunkName(kind, i)][max(offset - starts[i], 0):][:count - numRows]
+            buffer = fs.grow(buffer, numRows + len(chunk))
+            buffer[numRows:numRows + len(chunk)] = chunk
+            numRows += len(chunk)
+
+        self.assembled[kind] = (offset, numRows, last, buffer)
+
+        return buffer[:count]
+
+    def frame(self, i):
+        vertexOffset, vertexCount, faceOffset, faceCount = (int(value) for value in self.index[i])
+
+        return (self.rows("vertices", self.vertexStarts, vertexOffset, vertexCount),
+                self.rows("faces", self.faceStarts, faceOffset, faceCount))
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Minimal in-memory stand-ins for the PyAssimp scene classes, exposing the attributes the renderer reads
+class Material:
+    def __init__(self, diffuse = None, ambient = None):
+        self.properties = {
+            "diffuse": list(diffuse) if diffuse is not None else [0.6, 0.6, 0.6],
+            "ambient": list(ambient) if ambient is not None else [0., 0., 0.],
+        }
+
+class Mesh:
+    def __init__(self, vertices, faces, normals = None, material = None):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.faces = np.ascontiguousarray(faces, dtype=np.uint32)
+        self.normals = vertexNormals(self.vertices, self.faces) if normals is None else \
+            np.ascontiguousarray(normals, dtype=np.float32)
+        self.material = material if material is not None else Material()
+
+class Node:
+    def __init__(self, meshes = None, children = None, transformation = None):
+        self.meshes = meshes if meshes is not None else []
+        self.children = children if children is not None else []
+        self.transformation = transformation if transformation is not None else np.identity(4, dtype=np.float32)
+
+class Scene:
+    def __init__(self, meshes):
+        self.meshes = meshes
+        self.rootnode = Node(meshes)
+
+# Sum of the unnormalised normals of the faces around each of numVertices vertices. Sums over the faces of a mesh can
+# be added to those over more faces, so a mesh that only grows can keep its sums up to date with its new faces
+def normalSums(vertices, faces, numVertices):
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    corners = vertices[faces]
+    faceNormals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+    sums = np.zeros((numVertices, 3))
+    for axis in range(3):
+        for corner in range(3):
+            sums[:, axis] += np.bincount(faces[:, corner], weights=faceNormals[:, axis], minlength=numVertices)
+
+    return sums
+
+def normalise(sums):
+    lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+
+    return np.divide(sums, lengths, out=np.zeros_like(sums), where=lengths > 0).astype(np.float32)
+
+# Area weighted vertex normals: each face adds its unnormalised normal to its three vertices
+def vertexNormals(vertices, faces):
+    return normalise(normalSums(vertices, faces, len(vertices)))
+
+# Creates a renderable scene holding a single mesh
+def createScene(vertices, faces, normals = None):
+    return Scene([Mesh(vertices, faces, normals)])
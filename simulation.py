@@ -1,25 +1,126 @@
+import argparse
 import pymesh
-import pyassimp
-import pyassimp.postprocess as pp
 import numpy as np
 import crackMesh as cm
+import meshBuffer as mb
+import intersection as ix
+import distanceField as df
+import hostMesh as hm
+import toughnessField as tf
+import checkpoint as cp
+import incrementalBoolean as ib
+import sceneData as sd
+import frameStore as fs
+import runExporter as rx
+import randomStreams as rs
+import profiler as pf
 
 class Simulation:
-    def __init__(self):
-        self.min = -5.5
-        self.max = 5.5
-        minCorner = np.array([self.min, self.min, self.min])
-        maxCorner = np.array([self.max, self.max, self.max])
-        
-        self.crack = cm.CrackMesh([0., 0., 0.])
+    def __init__(self, numMarkers = 120, boxMin = -5.5, boxMax = 5.5, lowToughnessAreas = None, seed = None,
+                 useDistanceField = False, adaptiveStep = False, cacheDir = 'cache', exportObj = False,
+                 frameStorePath = None, keepScenes = True, maxMarkerSpacing = None, minMarkerSpacing = None,
+                 boxSamples = 1, hostMeshPath = None, toughnessFieldPath = None, cracks = None,
+                 booleanHost = False, booleanTiles = 4, booleanEngine = "cork", exportPath = None):
+        # The crack grows inside either a mesh loaded from a file, starting at the centre of its bounding box, or an
+        # axis-aligned box, starting at the origin. cracks can instead give any number of cracks, each a dict with a
+        # "start" location and optionally a "normal" to orient it by and a number of "markers"
+        self.host = None
+        self.hostLoadTime = 0.
+        startLocation = [0., 0., 0.]
+
+        if hostMeshPath is not None:
+            self.host = hm.HostMesh.cached(hostMeshPath, cacheDir)
+            self.hostLoadTime = self.host.loadTime
+            self.min = float(self.host.lower[1])
+            self.max = float(self.host.upper[1])
+            startLocation = self.host.centre
+
+            self.box = self.host.mesh
+            self.intersector = self.host.intersector
+        else:
+            self.min = boxMin
+            self.max = boxMax
+            minCorner = np.array([self.min, self.min, self.min])
+            maxCorner = np.array([self.max, self.max, self.max])
+
+            self.box = pymesh.generate_box_mesh(minCorner, maxCorner, num_samples = boxSamples, keep_symmetry=False,
+                                                subdiv_order=1)
+            self.intersector = ix.TriangleIntersector.fromMesh(self.box)
+
+        # Every random draw comes from streams derived from this seed, so a seed always gives the same meshes
+        self.random = rs.RandomStreams(seed)
         
-        self.box = pymesh.generate_box_mesh(minCorner, maxCorner, num_samples = 1, keep_symmetry=False,subdiv_order=1)
+        # Each crack gets its own random stream and keeps its own front, but they all add their strips to one buffer,
+        # with every face tagged with the index of its crack
+        if cracks is None:
+            cracks = [{"start": startLocation}]
+
+        self.crackBuffer = mb.MeshBuffer()
+        self.cracks = []
+        for k, spec in enumerate(cracks):
+            crack = cm.CrackMesh(spec["start"], spec.get("markers", numMarkers), self.random.crackGenerator(k),
+                                 spec.get("normal"), self.crackBuffer, k)
+            crack.maxSpacing = maxMarkerSpacing
+            crack.minSpacing = minMarkerSpacing
+            self.cracks.append(crack)
+
+        # The first crack, for code that only ever deals with one
+        self.crack = self.cracks[0]
+
+        # Optionally bake a signed distance field of the box, so most markers can skip the exact intersection test
+        if useDistanceField:
+            distanceField = df.SignedDistanceField.cached(self.box, cacheDir)
+            for crack in self.cracks:
+                crack.distanceField = distanceField
+                crack.adaptiveStep = adaptiveStep
+
+        # With booleanHost, each step's output is the host with the crack cut out of it rather than the crack itself.
+        # Only the tiles of the host that the newest strip reaches are re-cut
+        self.booleanHost = booleanHost
+        self.csg = ib.IncrementalDifference(self.box, booleanTiles, booleanEngine) if booleanHost else None
+
+        # Writing every step to an OBJ file and reading it back through PyAssimp is only done when asked for
+        self.exportObj = exportObj
         self.outFile = 'out.obj'
         self.scenes = []
+
+        # With a frame store, steps are written to disk rather than kept as scenes, and scenes is replaced by a
+        # reader over the store once the run is done. The scenes read back from OBJ files can't go in a store
+        if exportObj and frameStorePath:
+            raise ValueError("exportObj and frameStorePath can't be used together, got frameStorePath {!r}".format(
+                frameStorePath))
+
+        self.frameStorePath = frameStorePath
+        self.keepScenes = keepScenes
+
+        # With an export path, every step is also streamed into a single .npz file that holds the whole run
+        self.exportPath = exportPath
+
+        self.stepsRun = 0
+        self.profiler = pf.NULL_PROFILER
+
+        # Number of vertices and faces in the crack mesh after each step, which is all it takes to rebuild any
+        # step's mesh from the final one
+        self.frameCounts = []
         
         # Setup areas where material toughness is lower so that one is very slightly closer to the crack 
         # than the other, to demonstrate that the crack will favour one over the other
-        self.lowToughnessAreas = [self.max - 2.5, self.min - 2.]
+        if lowToughnessAreas is None:
+            lowToughnessAreas = [self.max - 2.5, self.min - 2.]
+
+        self.lowToughnessAreas = list(lowToughnessAreas)
+
+        # A toughness field loaded from disk replaces the planes entirely. Otherwise the planes are worked out from
+        # lowToughnessAreas whenever a run starts, so the list can still be changed after the simulation is created
+        self.toughnessField = tf.ToughnessField.load(toughnessFieldPath) if toughnessFieldPath is not None else None
+        self.toughness = self.createToughness()
+
+    # The loaded toughness field, or planes at the heights currently in lowToughnessAreas
+    def createToughness(self):
+        if self.toughnessField is not None:
+            return self.toughnessField
+
+        return tf.PlaneToughness(self.lowToughnessAreas)
     
     ''' 
     Runs the for loop for the simulation. Terminates once max number of steps has been reached, or all markers have
@@ -27,54 +128,300 @@ class Simulation:
         1. Propagates the crack front 
         2. Creates the corresponding crack mesh
         3. Uses CSG to merge the crack with the initial object mesh 
-        4. Finally converts to a PyAssimp mesh so it can be rendered with OpenGL
+        4. Finally converts to a scene so it can be rendered with OpenGL
+    onStep, if given, is called with the step index and the crack's mesh buffer after every step
+    With profile set, the time spent in each stage of every step, a few counters and the peak memory are recorded
+    in the returned Profiler; otherwise a NullProfiler with no steps is returned
+    With checkpointDir set, the state of the run is saved there every checkpointEvery steps and once it ends. With
+    resume also set, the run first carries on from the latest checkpoint in it, if there is one, and produces the same
+    result as a run that was never interrupted
     '''
-    def runSim(self, numSteps = 25):
+    def runSim(self, numSteps = 25, verbose = True, onStep = None, profile = False, traceMemory = False,
+               checkpointDir = None, checkpointEvery = 50, resume = False):
         crackMesh = None
-        initCrack = True
+        firstStep = 0
+
+        if resume and checkpointDir is not None:
+            path = cp.latestCheckpoint(checkpointDir)
+            if path is not None:
+                cp.restore(self, cp.load(path))
+                firstStep = self.stepsRun
+
+                # The tiles aren't checkpointed, but cutting the whole restored crack out at once leaves the same shape
+                if self.csg is not None:
+                    self.csg.subtract(self.crackBuffer.vertices, self.crackBuffer.faces, self.crackBuffer.pieces)
+                elif self.keepScenes and not self.exportObj and not self.frameStorePath:
+                    self.scenes = cp.rebuildScenes(self)
+
+                if verbose:
+                    print("Resuming from {} after step {}".format(path, firstStep))
+
+        initCrack = firstStep == 0
+        self.toughness = self.createToughness()
+        frames = fs.FrameStore(self.frameStorePath, firstStep) if self.frameStorePath else None
+        checkpoints = cp.CheckpointWriter(checkpointDir) if checkpointDir is not None else None
+        export = self.createExporter(firstStep) if self.exportPath else None
+
+        profiler = pf.Profiler(traceMemory) if profile else pf.NULL_PROFILER
+        self.profiler = profiler
+        for crack in self.cracks:
+            crack.profiler = profiler
         
-        for i in range(numSteps):
-            if self.crack.finishedMarkers < len(self.crack.markers):
-                self.crack.propagateCrackFront(self.box, self.lowToughnessAreas, initCrack)
-                initCrack = False
-                
-                crackV, crackF = self.crack.createCrackMesh()
+        # Everything opened for the run is closed even if a step raises, including StopSimulation from a live viewer
+        # ending the run early
+        completed = False
+        try:
+            for i in range(firstStep, numSteps):
+                if not all(crack.isFinished for crack in self.cracks):
+                    profiler.beginStep(i)
+                    verticesBefore, facesBefore = self.crackBuffer.numVertices, self.crackBuffer.numFaces
+
+                    self.propagateCracks(initCrack)
+                    initCrack = False
                 
-                if crackF:    
-                    crackMesh = self.processCrackMesh(crackV, crackF, crackMesh)
+                    with profiler.stage("meshUpdate"):
+                        crackBuffer = self.processCrackMesh()
+                    for crack in self.cracks:
+                        crack.refineFront()
+
+                    profiler.count("vertices", crackBuffer.numVertices - verticesBefore)
+                    profiler.count("faces", crackBuffer.numFaces - facesBefore)
                 
-#                mesh = pymesh.boolean(self.box, crackMesh, operation="difference", engine="cork")
+                    # The mesh a step outputs is the crack, which only grows, or with booleanHost the host minus the
+                    # crack, which doesn't
+                    vertices, faces, grows = crackBuffer.vertices, crackBuffer.faces, True
+                    if self.csg is not None:
+                        with profiler.stage("boolean"):
+                            tilesCut = self.csg.subtract(crackBuffer.vertices, crackBuffer.faces[facesBefore:],
+                                                         crackBuffer.pieces[facesBefore:])
+                            profiler.count("tilesCut", len(tilesCut))
+                            vertices, faces = self.csg.mesh()
+                        grows = False
+
+                    if self.exportObj:
+                        crackMesh = pymesh.form_mesh(np.copy(vertices), np.copy(faces))
+                        self.convertPyMeshToPyAssimp(crackMesh)
+                    elif frames is not None:
+                        with profiler.stage("output"):
+                            frames.append(vertices, faces, grows)
+                    elif self.keepScenes:
+                        with profiler.stage("output"):
+                            self.scenes.append(sd.createScene(vertices, faces))
+
+                    if export is not None:
+                        with profiler.stage("export"):
+                            export.append(vertices, faces, grows)
+
+                    self.stepsRun += 1
+                    self.frameCounts.append((crackBuffer.numVertices, crackBuffer.numFaces))
+
+                    if checkpoints is not None and checkpointEvery and self.stepsRun % checkpointEvery == 0:
+                        with profiler.stage("checkpoint"):
+                            checkpoints.submit(cp.capture(self))
+
+                    profiler.endStep()
 
-                self.convertPyMeshToPyAssimp(crackMesh)
+                    if onStep is not None:
+                        onStep(i, crackBuffer)
                 
-                print("Step {} complete! ({:.2%})".format(i + 1, ((i + 1) / numSteps)))
-            else:
-                print("Crack has finished propagating!")
-                break
+                    if verbose:
+                        print("Step {} complete! ({:.2%})".format(i + 1, ((i + 1) / numSteps)))
+                else:
+                    if verbose:
+                        print("Crack has finished propagating!")
+                    break
+
+            completed = True
+        finally:
+            profiler.close()
+
+            if frames is not None:
+                frames.close()
+                self.scenes = fs.FrameStoreReader(self.frameStorePath)
+
+            if export is not None:
+                export.close()
+
+            if checkpoints is not None:
+                # A step that raised may have left the state half updated, so only a finished run is saved at the end
+                if completed:
+                    checkpoints.submit(cp.capture(self))
+                checkpoints.close()
+
+        return profiler
                 
                 
     # Write the PyMesh mesh as an .obj file, then read it back in with PyAssimp and store the resulting
     # scene in a list
     def convertPyMeshToPyAssimp(self, crackMesh):
-        pymesh.save_mesh(self.outFile, crackMesh)
+        import pyassimp
+        import pyassimp.postprocess as pp
+
+        with self.profiler.stage("saveMesh"):
+            pymesh.save_mesh(self.outFile, crackMesh)
                 
-        scene = pyassimp.load(self.outFile, 'obj', pp.aiProcess_GenNormals)
+        with self.profiler.stage("assimpLoad"):
+            scene = pyassimp.load(self.outFile, 'obj', pp.aiProcess_GenNormals)
         
         self.scenes.append(scene)
-        
-    # Clean up the initial crack mesh by removing duplicate vertices/faces and degenerate triangles
-    # Then create the corresponding PyMesh mesh and return it
-    def processCrackMesh(self, crackV, crackF, crackMesh):
-        crackV, crackF, info = pymesh.remove_degenerated_triangles_raw(np.array(crackV), np.array(crackF))
-        
-        if crackMesh is None:
-            crackMesh = pymesh.form_mesh(np.array(crackV), np.array(crackF))
-        else:
-            newCrackMesh = pymesh.form_mesh(np.array(crackV), np.array(crackF))
-            crackMesh = pymesh.merge_meshes([crackMesh, newCrackMesh])
-            
-        # Process the crack mesh to clean it up
-        crackMesh, info = pymesh.remove_duplicated_vertices(crackMesh)
-        crackMesh, info = pymesh.remove_duplicated_faces(crackMesh)
-            
-        return crackMesh
\ No newline at end of file
+
+    # Opens the run export. A resumed run writes the export again from the start, as the one the interrupted run
+    # was writing can't be read. The crack's earlier steps are rebuilt from the restored buffer, but with
+    # booleanHost they are gone, so the export then starts at the step the run resumed from
+    def createExporter(self, firstStep):
+        if self.csg is not None:
+            return rx.RunExporter(self.exportPath, firstStep = firstStep)
+
+        export = rx.RunExporter(self.exportPath)
+        for numVertices, numFaces in self.frameCounts:
+            export.append(self.crackBuffer.vertices[:numVertices], self.crackBuffer.faces[:numFaces])
+
+        return export
+
+    # Steps every crack that is still growing. All of their markers are tested against the host mesh in one batch,
+    # then each crack records its own hits and smooths its front, and all the smoothing moves are tested in a second
+    # batch, so that smoothing can't push a marker through the mesh
+    def propagateCracks(self, initCrack):
+        cracks = [crack for crack in self.cracks if not crack.isFinished]
+
+        actives = [crack.advance(self.toughness, initCrack) for crack in cracks]
+        starts = [crack.front.prevLocations[active] for crack, active in zip(cracks, actives)]
+        self.intersectBatch(cracks, actives, starts)
+
+        actives, starts = zip(*[crack.smoothFront() for crack in cracks])
+        self.intersectBatch(cracks, actives, starts)
+
+    # Tests the segment from starts[k][i] to the current location of marker actives[k][i] of cracks[k], for every
+    # crack and marker at once
+    def intersectBatch(self, cracks, actives, starts):
+        with self.profiler.stage("intersection"):
+            p0 = np.concatenate(starts)
+            p1 = np.concatenate([crack.front.currLocations[active] for crack, active in zip(cracks, actives)])
+            hits, points = self.intersector.intersect(p0, p1)
+        self.profiler.count("trianglesTested", self.intersector.lastPairsTested)
+
+        ends = np.cumsum([len(active) for active in actives])
+        for crack, active, end in zip(cracks, actives, ends):
+            start = end - len(active)
+            crack.finishMarkers(active, hits[start:end], points[start:end])
+
+    # Summary of the state of the run, small enough to log for every run of a sweep
+    def summary(self):
+        crackBuffer = self.crackBuffer
+        locations = np.concatenate([crack.front.currLocations for crack in self.cracks])
+
+        return {
+            "entropy": str(self.random.entropy),
+            "steps": self.stepsRun,
+            "cracks": len(self.cracks),
+            "markers": sum(len(crack.front) for crack in self.cracks),
+            "finishedMarkers": sum(crack.finishedMarkers for crack in self.cracks),
+            "vertices": crackBuffer.numVertices,
+            "faces": crackBuffer.numFaces,
+            "frontMin": locations.min(axis=0).tolist(),
+            "frontMax": locations.max(axis=0).tolist(),
+            "frontMeanY": float(locations[:, 1].mean()),
+            "finishedOutside": self.finishedOutside(),
+        }
+
+    # Number of finished markers outside the host's bounding box by more than tolerance. A finished marker sits where
+    # it hit the host's surface, so this should always be 0
+    def finishedOutside(self, tolerance = 1e-6):
+        vertices = np.asarray(self.box.vertices)
+        lower = vertices.min(axis=0) - tolerance
+        upper = vertices.max(axis=0) + tolerance
+
+        return sum(int(np.count_nonzero(np.any((crack.front.currLocations[crack.front.finished] < lower) |
+                                               (crack.front.currLocations[crack.front.finished] > upper), axis=1)))
+                   for crack in self.cracks)
+
+    # Append the strip between the previous and current front of every crack to the shared mesh buffer
+    # Seam vertices are shared by index, so the accumulated mesh never needs merging or deduplicating
+    def processCrackMesh(self):
+        for crack in self.cracks:
+            crack.appendToMeshBuffer()
+
+        return self.crackBuffer
+
+
+# Runs a simulation without any of the viewer's dependencies and writes every step to a frame store, which
+# fractureSim.py can then play back
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Runs a fracture simulation headlessly")
+    parser.add_argument("--steps", type=int, default=100, help="maximum number of steps to simulate")
+    parser.add_argument("--markers", type=int, default=120, help="number of markers on the crack front")
+    parser.add_argument("--box-min", type=float, default=-5.5, help="minimum coordinate of the host box")
+    parser.add_argument("--box-max", type=float, default=5.5, help="maximum coordinate of the host box")
+    parser.add_argument("--box-samples", type=int, default=1,
+                        help="num_samples the host box is subdivided with, for larger host meshes")
+    parser.add_argument("--host-mesh", help="mesh file (OBJ, STL, PLY, ...) to fracture instead of the box")
+    parser.add_argument("--crack", type=float, nargs="+", action="append", metavar="X",
+                        help="start a crack at X Y Z, oriented with normal NX NY NZ if given after it "
+                             "(can be given more than once; default: one horizontal crack at the centre)")
+    parser.add_argument("--toughness", type=float, nargs="*",
+                        help="heights of the low toughness planes (default: box max - 2.5 and box min - 2)")
+    parser.add_argument("--toughness-field",
+                        help="directory of a gridded toughness field to use instead of the toughness planes")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--output", default="frames", help="directory the frame store is written to")
+    parser.add_argument("--distance-field", action="store_true",
+                        help="use a signed distance field to skip most intersection tests")
+    parser.add_argument("--adaptive-step", action="store_true",
+                        help="take longer steps far from the surface (needs --distance-field)")
+    parser.add_argument("--max-spacing", type=float,
+                        help="insert markers where neighbours are further apart than this")
+    parser.add_argument("--min-spacing", type=float, help="merge markers closer together than this")
+    parser.add_argument("--boolean", action="store_true",
+                        help="output the host with the crack cut out of it, re-cutting only the tiles each step reaches")
+    parser.add_argument("--boolean-tiles", type=int, default=4, help="number of tiles along each axis of the host")
+    parser.add_argument("--boolean-engine", default="cork", help="PyMesh boolean engine to cut with")
+    parser.add_argument("--export", metavar="PATH", help="also write every step of the run to this .npz file")
+    parser.add_argument("--cache-dir", default="cache", help="directory for cached preprocessed data")
+    parser.add_argument("--checkpoint-dir", help="directory to save checkpoints of the run to")
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="number of steps between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the latest checkpoint in --checkpoint-dir, if there is one")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write per-step stage timings and counters to PATH (.json or .csv)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record each step's peak Python allocation with tracemalloc when profiling")
+    args = parser.parse_args(argv)
+
+    cracks = None
+    if args.crack:
+        if any(len(values) not in (3, 6) for values in args.crack):
+            parser.error("--crack takes a location X Y Z and optionally a normal NX NY NZ")
+        cracks = [{"start": values[:3], "normal": values[3:] or None} for values in args.crack]
+
+    simulation = Simulation(numMarkers = args.markers, boxMin = args.box_min, boxMax = args.box_max,
+                            lowToughnessAreas = args.toughness, seed = args.seed,
+                            useDistanceField = args.distance_field, adaptiveStep = args.adaptive_step,
+                            cacheDir = args.cache_dir, frameStorePath = args.output,
+                            maxMarkerSpacing = args.max_spacing, minMarkerSpacing = args.min_spacing,
+                            boxSamples = args.box_samples, hostMeshPath = args.host_mesh,
+                            toughnessFieldPath = args.toughness_field, cracks = cracks,
+                            booleanHost = args.boolean, booleanTiles = args.boolean_tiles,
+                            booleanEngine = args.boolean_engine, exportPath = args.export)
+
+    if simulation.host is not None:
+        print("Loaded {} faces of {} {} in {:.3f}s".format(len(simulation.host.faces), args.host_mesh,
+                                                           "from the cache" if simulation.host.fromCache else "cold",
+                                                           simulation.hostLoadTime))
+
+    profiler = simulation.runSim(args.steps, profile = args.profile is not None, traceMemory = args.trace_memory,
+                                 checkpointDir = args.checkpoint_dir, checkpointEvery = args.checkpoint_every,
+                                 resume = args.resume)
+
+    print("Wrote {} frames to {}".format(len(simulation.scenes), args.output))
+    if args.export:
+        print("Exported the run to {}".format(args.export))
+
+    if args.profile:
+        profiler.save(args.profile)
+        totals = profiler.totals()
+        for name, seconds in sorted(totals["times"].items(), key=lambda item: -item[1]):
+            print("  {:<14} {:8.3f}s".format(name, seconds))
+        print("Wrote profile of {} steps to {}".format(totals["steps"], args.profile))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import queue
+import threading
+
+class StopSimulation(Exception):
+    pass
+
+# Runs a simulation on a background thread, publishing the number of steps run so far to a bounded queue after
+# every step. The simulation must write its steps to a frame store, which the consumer reads them back from with a
+# frameStore.FrameStoreReader, so nothing but the store's index grows in memory however long the run is
+# When the queue is full the simulation waits for the consumer to catch up, so it never gets more than maxQueued
+# steps ahead of it. A None on the queue marks the end of the run
+class SimulationWorker(threading.Thread):
+    def __init__(self, simulation, numSteps, maxQueued = 8):
+        super().__init__(daemon=True)
+        if not simulation.frameStorePath:
+            raise ValueError("a simulation run by a worker needs a frame store path, got {!r}".format(
+                simulation.frameStorePath))
+
+        self.simulation = simulation
+        self.numSteps = numSteps
+        self.frames = queue.Queue(maxQueued)
+        self.stopping = threading.Event()
+        self.error = None
+        self.stepsPublished = 0
+
+    def run(self):
+        try:
+            self.simulation.runSim(self.numSteps, verbose = False, onStep = self.publish)
+        except StopSimulation:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.put(None)
+            except StopSimulation:
+                pass
+
+    # The step has already been written to the frame store by the time this is called
+    def publish(self, step, crackBuffer):
+        self.stepsPublished += 1
+        self.put(self.stepsPublished)
+
+    def put(self, item):
+        while True:
+            if self.stopping.is_set():
+                raise StopSimulation()
+            try:
+                self.frames.put(item, timeout = .1)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self):
+        self.stopping.set()
+
+    # Number of steps in the frame store after the next finished step, None once the run is over, or nothing if no
+    # new step is ready yet
+    def poll(self):
+        try:
+            return True, self.frames.get_nowait()
+        except queue.Empty:
+            return False, None
@@ -0,0 +1,109 @@
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import simulation
+
+# Every combination of the values in grid (a dict of Simulation argument name to list of values) for every seed
+def createRuns(grid, seeds, numSteps):
+    names = sorted(grid)
+    runs = []
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        for seed in seeds:
+            params = dict(zip(names, values))
+            key = json.dumps({"params": params, "seed": seed, "steps": numSteps}, sort_keys=True)
+            runId = hashlib.sha1(key.encode()).hexdigest()[:16]
+            runs.append({"runId": runId, "params": params, "seed": seed, "steps": numSteps})
+
+    return runs
+
+# Ids of the runs that already finished successfully in a previous, possibly interrupted, sweep
+def completedRuns(resultsPath):
+    completed = set()
+    if not os.path.exists(resultsPath):
+        return completed
+
+    with open(resultsPath) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue    # A line cut short when the sweep was interrupted
+
+            if "error" not in result:
+                completed.add(result["runId"])
+
+    return completed
+
+# Runs one simulation in a worker process and returns its summary
+def runOne(run):
+    start = time.perf_counter()
+
+    sim = simulation.Simulation(seed = run["seed"], keepScenes = False, **run["params"])
+    sim.runSim(run["steps"], verbose = False)
+
+    result = dict(run)
+    result["summary"] = sim.summary()
+    result["wallTime"] = time.perf_counter() - start
+
+    return result
+
+# Runs every run not already in the results file across a process pool, appending each result to the file as soon
+# as it finishes. A run that raises, or whose worker dies, is recorded with an error and retried on the next sweep
+def runSweep(runs, resultsPath, workers = None):
+    completed = completedRuns(resultsPath)
+    pending = [run for run in runs if run["runId"] not in completed]
+    print("{} runs, {} already complete, {} to run".format(len(runs), len(runs) - len(pending), len(pending)))
+
+    with open(resultsPath, 'a') as results, concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(runOne, run): run for run in pending}
+
+        try:
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                run = futures[future]
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = dict(run)
+                    result["error"] = repr(e)
+
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+
+                print("Run {} {} ({}/{})".format(run["runId"], "failed" if "error" in result else "complete",
+                                                 i + 1, len(pending)))
+        except KeyboardInterrupt:
+            print("Sweep interrupted, run it again to resume")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Runs many independent simulations across a process pool")
+    parser.add_argument("--grid", help="JSON file mapping Simulation arguments to lists of values")
+    parser.add_argument("--seeds", type=int, nargs="+", help="seeds to run every parameter combination with")
+    parser.add_argument("--num-seeds", type=int, default=1, help="run seeds 0 to n - 1, if --seeds is not given")
+    parser.add_argument("--steps", type=int, default=100, help="maximum number of steps per run")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: one per core)")
+    parser.add_argument("--results", default="sweep.jsonl", help="file results are appended to")
+    args = parser.parse_args(argv)
+
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+
+    seeds = args.seeds if args.seeds is not None else list(range(args.num_seeds))
+
+    try:
+        runSweep(createRuns(grid, seeds, args.steps), args.results, args.workers)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
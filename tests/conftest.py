@@ -0,0 +1,52 @@
+import os
+import sys
+import types
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Just enough of pymesh to build the box a simulation grows in and hold meshes, for when it isn't installed
+class Mesh:
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+def form_mesh(vertices, faces):
+    return Mesh(vertices, faces)
+
+# Axis-aligned box with each side split into num_samples x num_samples squares of two triangles each. The sides
+# don't share vertices, which the simulation doesn't need
+def generate_box_mesh(minCorner, maxCorner, num_samples = 1, keep_symmetry = False, subdiv_order = 0):
+    minCorner = np.asarray(minCorner, dtype=float)
+    maxCorner = np.asarray(maxCorner, dtype=float)
+    samples = np.linspace(0., 1., num_samples + 1)
+
+    vertices = []
+    faces = []
+    for axis in range(3):
+        a, b = [other for other in range(3) if other != axis]
+        for corner in (minCorner, maxCorner):
+            first = len(vertices)
+            for i in samples:
+                for j in samples:
+                    vertex = np.copy(corner)
+                    vertex[a] = minCorner[a] + (maxCorner[a] - minCorner[a]) * i
+                    vertex[b] = minCorner[b] + (maxCorner[b] - minCorner[b]) * j
+                    vertices.append(vertex)
+
+            for i in range(num_samples):
+                for j in range(num_samples):
+                    q = first + i * (num_samples + 1) + j
+                    faces.append([q, q + num_samples + 1, q + 1])
+                    faces.append([q + 1, q + num_samples + 1, q + num_samples + 2])
+
+    return Mesh(np.array(vertices), np.array(faces))
+
+try:
+    import pymesh
+except ImportError:
+    pymesh = types.ModuleType("pymesh")
+    pymesh.Mesh = Mesh
+    pymesh.form_mesh = form_mesh
+    pymesh.generate_box_mesh = generate_box_mesh
+    sys.modules["pymesh"] = pymesh
@@ -0,0 +1,109 @@
+import numpy as np
+import pymesh
+import pytest
+
+import intersection as ix
+
+# The per-marker test CrackMesh.checkIntersection used to run, one triangle at a time
+def checkIntersection(p0, p1, mesh):
+    SMALL_NUM = 0.000001
+    isectPoint = np.zeros(3)
+    dir = p1 - p0
+
+    for face in mesh.faces:
+        v0 = mesh.vertices[face[0]]
+        v1 = mesh.vertices[face[1]]
+        v2 = mesh.vertices[face[2]]
+
+        u = v1 - v0
+        v = v2 - v0
+        n = np.cross(u, v)
+        if np.count_nonzero(n) == 0:
+            continue
+
+        w0 = p0 - v0
+        a = -np.dot(n, w0)
+        b = np.dot(n, dir)
+        if abs(b) < SMALL_NUM:
+            continue
+
+        r = a / b
+        if r < 0.0 or r > 1.0:
+            continue
+
+        isectPoint = p0 + (r * dir)
+
+        uu = np.dot(u, u)
+        uv = np.dot(u, v)
+        vv = np.dot(v, v)
+        w = isectPoint - v0
+        wu = np.dot(w, u)
+        wv = np.dot(w, v)
+        D = uv * uv - uu * vv
+
+        s = (uv * wv - vv * wu) / D
+        if s < 0.0 or s > 1.0:
+            continue
+
+        t = (uv * wu - uu * wv) / D
+        if t < 0.0 or (s + t) > 1.0:
+            continue
+
+        return isectPoint, True
+
+    return isectPoint, False
+
+# A box split finely enough to be worth a BVH, with a degenerate triangle added on
+def boxMesh():
+    box = pymesh.generate_box_mesh([-1., -1., -1.], [1., 1., 1.], num_samples = 4)
+    faces = np.vstack((box.faces, [[0, 0, 1]]))
+
+    return pymesh.form_mesh(box.vertices, faces)
+
+# Segments around the box's surface, some crossing it, some parallel to a side and some ending exactly on it
+def segments():
+    rng = np.random.default_rng(7)
+    p0 = rng.uniform(-1.3, 1.3, (400, 3))
+    p1 = p0 + rng.normal(scale=.4, size=(400, 3))
+
+    parallel = rng.uniform(-.9, .9, (20, 3))
+    parallel[:, 1] = 1.
+    p0 = np.vstack((p0, parallel, [[0., 0., 0.], [.3, .2, .1]]))
+    p1 = np.vstack((p1, parallel + [.5, 0., .5], [[0., 0., 1.], [.3, 1.5, .1]]))
+
+    return p0, p1
+
+@pytest.mark.parametrize("useBvh", [False, True])
+def test_matches_per_triangle_loop(useBvh):
+    mesh = boxMesh()
+    p0, p1 = segments()
+
+    intersector = ix.TriangleIntersector.fromMesh(mesh, useBvh = useBvh)
+    hits, points = intersector.intersect(p0, p1)
+
+    expected = [checkIntersection(a, b, mesh) for a, b in zip(p0, p1)]
+    expectedHits = np.array([hit for point, hit in expected])
+    expectedPoints = np.array([point for point, hit in expected])
+
+    assert 0 < np.count_nonzero(expectedHits) < len(p0)
+    assert np.array_equal(hits, expectedHits)
+    assert np.array_equal(points[hits], expectedPoints[expectedHits])
+
+def test_bvh_matches_brute_force():
+    mesh = boxMesh()
+    p0, p1 = segments()
+
+    bruteForce = ix.TriangleIntersector.fromMesh(mesh, useBvh = False)
+    withBvh = ix.TriangleIntersector.fromMesh(mesh, useBvh = True)
+    hits, points = bruteForce.intersect(p0, p1)
+    bvhHits, bvhPoints = withBvh.intersect(p0, p1)
+
+    assert np.array_equal(hits, bvhHits)
+    assert np.array_equal(points, bvhPoints)
+    assert withBvh.lastPairsTested < bruteForce.lastPairsTested
+
+def test_no_segments():
+    hits, points = ix.TriangleIntersector.fromMesh(boxMesh()).intersect(np.zeros((0, 3)), np.zeros((0, 3)))
+
+    assert hits.shape == (0,)
+    assert points.shape == (0, 3)
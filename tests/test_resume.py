@@ -0,0 +1,45 @@
+import numpy as np
+
+import frameStore as fs
+import runExporter as rx
+import simulation
+
+def run(path, numSteps, **kwargs):
+    sim = simulation.Simulation(seed = 5, keepScenes = False, boxSamples = 2, frameStorePath = str(path / "frames"),
+                                exportPath = str(path / "run.npz"))
+    sim.runSim(numSteps, verbose = False, **kwargs)
+
+    return sim
+
+def assertSameFrames(a, b):
+    assert len(a) == len(b)
+    for i in range(len(a)):
+        vertices, faces = a.frame(i)
+        otherVertices, otherFaces = b.frame(i)
+        assert np.array_equal(vertices, otherVertices)
+        assert np.array_equal(faces, otherFaces)
+
+# A run stopped part way and resumed from its last checkpoint ends up where one left to finish does
+def test_resume_matches_uninterrupted_run(tmp_path):
+    (tmp_path / "full").mkdir()
+    (tmp_path / "resumed").mkdir()
+    checkpointDir = str(tmp_path / "checkpoints")
+
+    full = run(tmp_path / "full", 30)
+    run(tmp_path / "resumed", 13, checkpointDir = checkpointDir, checkpointEvery = 5)
+    resumed = run(tmp_path / "resumed", 30, checkpointDir = checkpointDir, checkpointEvery = 5, resume = True)
+
+    assert resumed.stepsRun == full.stepsRun
+    assert np.array_equal(resumed.crackBuffer.vertices, full.crackBuffer.vertices)
+    assert np.array_equal(resumed.crackBuffer.faces, full.crackBuffer.faces)
+    for crack, fullCrack in zip(resumed.cracks, full.cracks):
+        assert np.array_equal(crack.front.currLocations, fullCrack.front.currLocations)
+
+    for name in (fs.VERTEX_FILE, fs.FACE_FILE, fs.INDEX_FILE):
+        assert (tmp_path / "resumed" / "frames" / name).read_bytes() == (tmp_path / "full" / "frames" / name).read_bytes()
+
+    with rx.RunExportReader(str(tmp_path / "full" / "run.npz")) as a, \
+         rx.RunExportReader(str(tmp_path / "resumed" / "run.npz")) as b:
+        assert len(a) > 13
+        assert a.firstStep == b.firstStep
+        assertSameFrames(a, b)
@@ -0,0 +1,63 @@
+import math
+import numpy as np
+import pytest
+
+import toughnessField as tf
+
+# The weight Marker.calcMovementWeight used to give one marker, searching the planes in the order they were listed
+def calcMovementWeight(location, lowToughnessAreas):
+    deltaY = 1000.
+    lowestToughnessArea = 0.
+    maxWeight = .67
+
+    for y in lowToughnessAreas:
+        if abs(location[1] - y) < deltaY:
+            lowestToughnessArea = y
+            deltaY = abs(location[1] - y)
+
+    maxThreshold = lowestToughnessArea
+    constant = maxThreshold / (maxThreshold + .35)
+    scalarVal = pow(math.exp(.357 * pow(((constant * deltaY) - maxThreshold), 3.)), math.pi / 10.) + .004
+
+    scalarVal = min(scalarVal, 1.)
+    scalarVal = max(scalarVal, 0.)
+
+    weight = maxWeight * scalarVal
+    if lowestToughnessArea < location[1]:
+        weight = -weight
+
+    return weight
+
+def movementWeights(locations, heights):
+    normals = np.tile([0., 1., 0.], (len(locations), 1))
+
+    return tf.PlaneToughness(heights).movementWeights(locations, normals)
+
+@pytest.mark.parametrize("heights", [[], [2.], [-3., 1.5, 4.], [4., 1.5, -3.], [1., -2., 1., 3.5, -2.], [0., 0.]])
+def test_matches_per_marker_loop(heights):
+    rng = np.random.default_rng(3)
+    y = np.concatenate((rng.uniform(-6., 6., 300), heights, [-5.5, 0., 5.5]))
+    locations = np.zeros((len(y), 3))
+    locations[:, 1] = y
+
+    expected = [calcMovementWeight(location, heights) for location in locations]
+
+    assert np.allclose(movementWeights(locations, heights), expected, rtol=1e-12, atol=0.)
+
+# Halfway between two planes, the loop keeps whichever was listed first
+@pytest.mark.parametrize("heights", [[-1., 2.], [2., -1.], [2., -1., 2.], [-1., 2., -1.]])
+def test_ties_go_to_first_listed(heights):
+    locations = np.array([[0., .5, 0.]])
+
+    expected = calcMovementWeight(locations[0], heights)
+
+    assert np.allclose(movementWeights(locations, heights), [expected], rtol=1e-12, atol=0.)
+
+# Far enough from every plane the loop overflows, where the weight is now clamped to its largest
+def test_far_from_planes_is_clamped():
+    locations = np.array([[0., 500., 0.], [0., -500., 0.]])
+
+    with pytest.raises(OverflowError):
+        calcMovementWeight(locations[0], [3.])
+
+    assert np.array_equal(movementWeights(locations, [3.]), [-.67, .67])
@@ -0,0 +1,137 @@
+import json
+import os
+import numpy as np
+import voxelGrid as vg
+
+# Toughness of the host material and how strongly it pulls the crack front towards its weaker parts
+# Anything with a movementWeights(locations, normals) method can be passed wherever lowToughnessAreas is expected
+
+# Piecewise linear curve, looked up for every marker at once with np.interp
+class WeightCurve:
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+
+    def __call__(self, values):
+        return np.interp(values, self.x, self.y)
+
+# Maps how fast toughness falls along a marker's normal, relative to the toughness there, to the fraction of the
+# maximum weight it gets. Values past the end of the table get the full weight
+DEFAULT_CURVE = WeightCurve([0., .1, .25, .5, 1.], [0., .1, .4, .8, 1.])
+
+# Toughness sampled on a regular voxel grid, such as one exported from CT or FE data, read back with trilinear
+# interpolation. The grid can be memory mapped, so only the cells the front passes through are ever read
+class ToughnessField:
+    def __init__(self, toughness, origin, spacing, curve = DEFAULT_CURVE, maxWeight = .67):
+        self.toughness = toughness
+        self.origin = np.asarray(origin, dtype=float)
+        self.spacing = np.asarray(spacing, dtype=float)
+        self.curve = curve
+        self.maxWeight = maxWeight
+
+        if self.toughness.ndim != 3 or min(self.toughness.shape) < 2:
+            raise ValueError("toughness grid must have at least 2 cells along each axis, got shape {}".format(
+                self.toughness.shape))
+
+    # Loads a field written by save. The grid is memory mapped unless mmap is False
+    @classmethod
+    def load(cls, directory, mmap = True, **kwargs):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+
+        toughness = np.load(os.path.join(directory, "toughness.npy"), mmap_mode='r' if mmap else None)
+
+        return cls(toughness, meta["origin"], meta["spacing"], **kwargs)
+
+    # Stored as a .npy file, which np.load can memory map, with the grid's placement alongside it
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "toughness.npy"), np.asarray(self.toughness))
+
+        with open(os.path.join(directory, "meta.json"), 'w') as f:
+            json.dump({"origin": self.origin.tolist(), "spacing": self.spacing.tolist()}, f, indent=2)
+
+    # Trilinearly interpolated toughness at each point and its gradient. Points outside the grid take the value at
+    # its border, with no gradient along the axes they are outside on
+    def sample(self, points):
+        values, gradients, offsets = vg.trilinear(self.toughness, self.origin, self.spacing, points, gradients = True)
+
+        return values, gradients
+
+    # Markers are pulled along their normal towards lower toughness, more strongly the faster it falls
+    def movementWeights(self, locations, normals):
+        values, gradients = self.sample(locations)
+        slopes = -np.sum(gradients * normals, axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relativeSlopes = np.where(values > 0., np.abs(slopes) / values, np.inf)
+
+        return self.maxWeight * np.sign(slopes) * self.curve(relativeSlopes)
+
+# Horizontal planes of low toughness at the given heights, which is what lowToughnessAreas always was
+# Each marker is pulled towards its closest plane, found with a binary search so the cost per marker barely grows
+# with the number of planes
+class PlaneToughness:
+    def __init__(self, heights, maxWeight = .67):
+        heights = np.asarray(heights, dtype=float).ravel()
+        self.maxWeight = maxWeight
+
+        # Ties between two planes go to the one listed first, so the original order is kept alongside
+        self.order = np.argsort(heights, kind='stable')
+        self.heights = heights[self.order]
+
+    def __len__(self):
+        return len(self.heights)
+
+    # Height of, and distance to, the closest plane to each y-coordinate
+    def closestPlanes(self, y):
+        above = np.minimum(np.searchsorted(self.heights, y), len(self.heights) - 1)
+
+        # The first copy of a height listed more than once comes first in sorted order, so below is moved back to it
+        below = np.searchsorted(self.heights, self.heights[np.maximum(above - 1, 0)], side='left')
+
+        aboveDistances = np.abs(y - self.heights[above])
+        belowDistances = np.abs(y - self.heights[below])
+        useAbove = (aboveDistances < belowDistances) | \
+                   ((aboveDistances == belowDistances) & (self.order[above] < self.order[below]))
+
+        return np.where(useAbove, self.heights[above], self.heights[below]), \
+               np.where(useAbove, aboveDistances, belowDistances)
+
+    def movementWeights(self, locations, normals):
+        y = locations[:, 1]
+        maxWeight = self.maxWeight
+
+        if len(self.heights) > 0:
+            lowestToughnessArea, deltaY = self.closestPlanes(y)
+
+            # Areas further than the initial search distance are ignored
+            tooFar = deltaY >= 1000.
+            deltaY[tooFar] = 1000.
+            lowestToughnessArea[tooFar] = 0.
+        else:
+            deltaY = np.full(len(y), 1000.)
+            lowestToughnessArea = np.zeros(len(y))
+
+        maxThreshold = lowestToughnessArea
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            constant = maxThreshold / (maxThreshold + .35)
+
+            # Determined this equation through trial and error
+            scalarVal = np.power(np.exp(.357 * np.power((constant * deltaY) - maxThreshold, 3.)), np.pi / 10.) + .004
+
+        # Clamp value
+        scalarVal = np.clip(np.nan_to_num(scalarVal, nan=0., posinf=1.), 0., 1.)
+
+        weight = maxWeight * scalarVal
+
+        # The planes are horizontal, so only the vertical part of each marker's normal moves it towards them
+        return np.where(lowestToughnessArea < y, -weight, weight) * normals[:, 1]
+
+# Wraps a plain list of plane heights, leaving anything that is already a toughness model as it is
+def asToughness(lowToughnessAreas):
+    if hasattr(lowToughnessAreas, "movementWeights"):
+        return lowToughnessAreas
+
+    return PlaneToughness(lowToughnessAreas)
@@ -0,0 +1,41 @@
+import numpy as np
+
+# Trilinear interpolation of values sampled on a regular voxel grid, whose first sample is at origin with spacing
+# between samples along each axis. Points outside the grid take the value at its border
+# Returns the interpolated value at each point, its gradient if asked for (with no gradient along the axes a point is
+# outside the grid on), and each point's offset from the grid, which is zero for points inside it
+def trilinear(grid, origin, spacing, points, gradients = False):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    shape = np.array(grid.shape)
+
+    cells = (points - origin) / spacing
+    clamped = np.clip(cells, 0., shape - 1.)
+    offsets = (cells - clamped) * spacing
+
+    lower = np.minimum(np.floor(clamped).astype(np.int64), shape - 2)
+    t = clamped - lower
+    x, y, z = lower[:, 0], lower[:, 1], lower[:, 2]
+    tx, ty, tz = t[:, 0], t[:, 1], t[:, 2]
+
+    c000, c100 = grid[x, y, z], grid[x + 1, y, z]
+    c010, c110 = grid[x, y + 1, z], grid[x + 1, y + 1, z]
+    c001, c101 = grid[x, y, z + 1], grid[x + 1, y, z + 1]
+    c011, c111 = grid[x, y + 1, z + 1], grid[x + 1, y + 1, z + 1]
+
+    def lerp(a, b, s):
+        return a + (b - a) * s
+
+    c00, c10 = lerp(c000, c100, tx), lerp(c010, c110, tx)
+    c01, c11 = lerp(c001, c101, tx), lerp(c011, c111, tx)
+    c0, c1 = lerp(c00, c10, ty), lerp(c01, c11, ty)
+
+    values = lerp(c0, c1, tz)
+    if not gradients:
+        return values, None, offsets
+
+    # Derivatives of the interpolant with respect to each cell coordinate, scaled to world units
+    dx = lerp(lerp(c100 - c000, c110 - c010, ty), lerp(c101 - c001, c111 - c011, ty), tz)
+    dy = lerp(c10 - c00, c11 - c01, tz)
+    dz = c1 - c0
+
+    return values, np.stack((dx, dy, dz), axis=1) / spacing * (offsets == 0.), offsets